@@ -6,45 +6,406 @@
 #
 
 import argparse
+import fnmatch
+import glob
+import hashlib
+import io
+import json
 import logging
+import operator
 import os
-
+import re
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ankibox.ankinote_parser import ends_with_divider
+from ankibox.ankinote_parser import parse_ankinote
 from ankibox.app_config import Config
+from ankibox.atomic_write import append_durably
+from ankibox.atomic_write import write_atomically
+from ankibox.cache import CardBackCache
+from ankibox.cache import ChunkHashCache
+from ankibox.cache import IWQueueCache
+from ankibox.cache import SummaryCache
+from ankibox.fingerprint import get_fingerprint
+from ankibox.fingerprint import is_racy
+from ankibox.journal import DeleteJournal
+from ankibox.journal import PHASE_INTERMEDIARY_WRITTEN
+from ankibox.journal import PHASE_PLANNED
+from ankibox.journal import get_entry_key
+from ankibox.journal import get_title_hash
+from ankibox.profiling import Profiler
+from ankibox.scan import scan_directory
+from ankibox.scan import stat_path
+from ankibox.snapshot import Snapshot
+from ankibox.state import diff_snapshots
 # from app_config import Config
 
 
+UNRESOLVED = object()   # a Note's filepath before it has been looked up
+
+
 
 
 class VaultIndex:
     '''
+    an index of every file in the vault
+
+    the index is a dict of basename -> list of filepaths, so a
+    lookup by filename is a single dict access instead of a scan
+    over every path in the vault
+
+    lookups that contain a "/" (e.g. "folder/note.md") are resolved
+    against the basename bucket and then remembered in a suffix index
+
+    the directory listings behind the index are persisted to a cache
+    file next to the config, along with each directory's mtime. on
+    later runs only the directories whose mtime changed are listed
+    again, everything else comes straight out of the cache. (a
+    directory changed too recently to trust its mtime, see is_racy,
+    is stored without one, so it is always listed again next time)
+
+    a long-lived process (the daemon, --watch) keeps the listings in
+    memory too: expire() marks the index stale, and the next lookup
+    refreshes it from the listings it already has, instead of from
+    the cache file. if no directory changed, the index is kept as is
+
+    only the files a note lookup could ever want are indexed. from
+    the config (all optional):
+
+    - vault_index_extensions: file extensions to index (default
+      [".md"], an empty list indexes every file)
+    - vault_index_exclude: globs for directories and files to skip
+      (default [".obsidian", ".git", ".trash"]), matched against
+      both the name and the path relative to vault_root. excluded
+      directories are pruned, so the walk never enters them.
+      file_ankinote_storage is always excluded when it is inside
+      the vault (the ankinotes in it are never looked up)
+    - vault_index_include: globs a file must match to be indexed
+      (default [], i.e. every file with one of the extensions)
     '''
 
     _index = None
-
-    def __init__(self):
+    _suffix_index = None
+    _dirs = None            # the directory listings behind _index
+    _expired = False
+    _reported_ambiguous = set()
+    _log = logging.getLogger("VaultIndex")
+    _lock = threading.Lock()
+
+    def __init__(self, rebuild=False, cached_dirs=None):
         self.log = logging.getLogger(self.__class__.__name__)
         self.vault_root = Config.get_config_item("vault_root")
+        self.cache_path = os.path.join(Config.get_config_dir(), "vault_index.json")
+
+        self.filters = {
+            'extensions': Config.get_optional_config_item("vault_index_extensions", [".md"]),
+            'exclude': Config.get_optional_config_item("vault_index_exclude", [".obsidian", ".git", ".trash"])
+                       + self.get_storage_exclude(),
+            'include': Config.get_optional_config_item("vault_index_include", []),
+        }
+        self.extensions = tuple(self.filters['extensions'])
+        self.exclude = self.compile_globs(self.filters['exclude'])
+        self.include = self.compile_globs(self.filters['include'])
+
+        if rebuild:
+            self.log.debug("rebuilding vault index from scratch...")
+            cached_dirs = {}
+        elif cached_dirs is None:
+            cached_dirs = self.load_cache()
+        in_memory = cached_dirs is VaultIndex._dirs
+
+        dirs, changed = self.refresh(cached_dirs)
+        VaultIndex._dirs = dirs
+        if rebuild:
+            self.log.info("vault index rebuilt: {} files indexed, {} files and {} directories skipped".format(
+                sum(len(listing['files']) for listing in dirs.values()),
+                sum(listing['skipped_files'] for listing in dirs.values()),
+                sum(listing['skipped_dirs'] for listing in dirs.values()),
+            ))
+        if in_memory and not changed and VaultIndex._index is not None:
+            self.log.debug("vault unchanged, index kept")
+            return
 
-        VaultIndex._index = []
-        for dir, subdir, files in os.walk(self.vault_root):
-            for file in files:
-                VaultIndex._index.append("{}/{}".format(dir, file))
+        # built aside and swapped in, so a lookup running in another
+        # thread never sees a half-built index
+        index = {}
+        for dir, listing in dirs.items():
+            for file in listing['files']:
+                index.setdefault(file, []).append("{}/{}".format(dir, file))
+        VaultIndex._suffix_index = {}
+        VaultIndex._index = index
 
+        self.log.debug("{} filenames indexed.".format(len(index)))
         self.log.debug("done.")
 
 
+    def get_storage_exclude(self):
+        '''
+        a glob for file_ankinote_storage (relative to vault_root),
+        if it is inside the vault
+        '''
+        storage = Config.get_optional_config_item("file_ankinote_storage", None)
+        if not storage:
+            return []
+        relpath = os.path.relpath(os.path.abspath(storage), os.path.abspath(self.vault_root))
+        if relpath == "." or relpath == ".." or relpath.startswith("../"):
+            return []
+        return [glob.escape(relpath)]
+
+
+    def compile_globs(self, globs):
+        '''
+        one regex matching any of the globs (or None if there are none)
+        '''
+        if not globs:
+            return None
+        return re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+
+
+    def matches(self, pattern, name, relpath):
+        return bool(pattern.match(name) or pattern.match(relpath))
+
+
+    def load_cache(self):
+        '''
+        read the cached directory listings, if there are any
+        (and if they were made for the same vault_root, with
+        the same filters)
+        '''
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            self.log.debug("no usable vault index cache found")
+            return {}
+
+        if cache.get('vault_root') != self.vault_root:
+            self.log.debug("vault index cache is for a different vault_root, ignoring it")
+            return {}
+        if cache.get('filters') != self.filters:
+            self.log.debug("vault index cache was made with different filters, ignoring it")
+            return {}
+        return cache['dirs']
+
+
+    def save_cache(self, dirs):
+        '''
+        write the directory listings to the cache file
+        (atomically, so a crash never leaves a half-written
+        cache behind)
+        '''
+        cache = {'vault_root': self.vault_root, 'filters': self.filters, 'dirs': dirs}
+        try:
+            write_atomically(self.cache_path, [json.dumps(cache)])
+        except OSError as e:
+            self.log.warning("could not write vault index cache: {}".format(e))
+
+
+    def refresh(self, cached_dirs):
+        '''
+        walk the vault top-down (in the same order as os.walk)
+        but only list the directories that changed since the
+        cache was written
+
+        returns a dict of dirpath -> {mtime_ns, files, subdirs,
+        skipped_files, skipped_dirs}, and whether any listing
+        differs from the cached one
+        '''
+        dirs = {}
+        changed = False
+        rescanned = 0
+        skipped_files = 0
+        skipped_dirs = 0
+        stack = [self.vault_root]
+        while stack:
+            dir = stack.pop()
+            info = stat_path(dir)
+            if info is None:
+                # directory disappeared since its parent was listed
+                continue
+            mtime_ns = info.fingerprint[0]
+
+            listing = cached_dirs.get(dir)
+            if listing is None or listing['mtime_ns'] != mtime_ns:
+                cached_listing = listing
+                listing = self.list_directory(dir, mtime_ns)
+                rescanned += 1
+                changed = changed or cached_listing is None or (
+                    listing['files'] != cached_listing['files']
+                    or listing['subdirs'] != cached_listing['subdirs']
+                )
+                if is_racy(info.fingerprint):
+                    listing['mtime_ns'] = None
+            dirs[dir] = listing
+            skipped_files += listing['skipped_files']
+            skipped_dirs += listing['skipped_dirs']
+
+            for subdir in reversed(listing['subdirs']):
+                stack.append(os.path.join(dir, subdir))
+
+        self.log.debug("{} of {} directories rescanned".format(rescanned, len(dirs)))
+        self.log.debug("{} files and {} directories skipped".format(skipped_files, skipped_dirs))
+        Profiler.count("vault directories checked", len(dirs))
+        Profiler.count("vault directories listed", rescanned)
+        Profiler.count("vault files skipped", skipped_files)
+        Profiler.count("vault directories skipped", skipped_dirs)
+        changed = changed or len(dirs) != len(cached_dirs)
+        if rescanned or changed:
+            self.save_cache(dirs)
+        return dirs, changed
+
+
+    def list_directory(self, dir, mtime_ns):
+        '''
+        list one directory, splitting its entries into files and
+        subdirectories the same way os.walk does (symlinked
+        directories are not descended into), and dropping the
+        ones the filters exclude
+        '''
+        files = []
+        subdirs = []
+        skipped_files = 0
+        skipped_dirs = 0
+        relpath = os.path.relpath(dir, self.vault_root)
+        prefix = "" if relpath == "." else "{}/".format(relpath)
+        try:
+            entries = scan_directory(dir)
+        except OSError as e:
+            self.log.debug("could not list \"{}\": {}".format(dir, e))
+            entries = []
+
+        for entry in entries:
+            name = entry.name
+            excluded = self.exclude and self.matches(self.exclude, name, prefix + name)
+            if not entry.is_dir:
+                if (excluded
+                        or (self.extensions and not name.endswith(self.extensions))
+                        or (self.include and not self.matches(self.include, name, prefix + name))):
+                    skipped_files += 1
+                else:
+                    files.append(name)
+            elif not entry.is_symlink:
+                if excluded:
+                    skipped_dirs += 1
+                else:
+                    subdirs.append(name)
+        return {
+            'mtime_ns': mtime_ns,
+            'files': files,
+            'subdirs': subdirs,
+            'skipped_files': skipped_files,
+            'skipped_dirs': skipped_dirs,
+        }
+
+
+    @staticmethod
+    def load():
+        '''
+        build the index the first time it is needed, so runs that
+        never look a note up (e.g. --summary) never walk the vault.
+        an expired index is refreshed from the listings in memory
+        '''
+        with VaultIndex._lock:
+            if VaultIndex._index is None:
+                with Profiler.phase(None, "vault index"):
+                    VaultIndex()
+            elif VaultIndex._expired:
+                with Profiler.phase(None, "vault index refresh"):
+                    VaultIndex(cached_dirs=VaultIndex._dirs)
+            VaultIndex._expired = False
+
+
+    @staticmethod
+    def unload():
+        '''
+        forget the index, so the next lookup loads it again
+        (incrementally, from the cache) and sees any new files
+        '''
+        with VaultIndex._lock:
+            VaultIndex._index = None
+            VaultIndex._suffix_index = None
+            VaultIndex._dirs = None
+            VaultIndex._expired = False
+            VaultIndex._reported_ambiguous = set()
+
+
+    @staticmethod
+    def expire():
+        '''
+        mark the index stale without dropping it: the next lookup
+        lists only the directories whose mtime changed, and keeps
+        the index if none of them did (a run that never looks a
+        note up does no work at all)
+        '''
+        with VaultIndex._lock:
+            VaultIndex._expired = True
+            VaultIndex._reported_ambiguous = set()
+
+
     @staticmethod
     def get_note_filepath(filename):
         '''
+        return the filepath of a note, given its filename
+
+        if more than one file in the vault has the same name, the
+        ambiguity is reported and the first one found is returned
+
+        a lookup with a "/" in it matches the files whose path ends
+        with it, i.e. whole path components only ("1/note.md" does
+        not match ".../folder1/note.md")
         '''
+        if VaultIndex._index is None or VaultIndex._expired:
+            VaultIndex.load()
+        if Profiler.enabled:
+            Profiler.count("vault index lookups")
         if "/" in filename:
-            for filepath in VaultIndex._index:
-                if filename in filepath:
-                    return filepath
+            if filename not in VaultIndex._suffix_index:
+                basename = filename.split("/")[-1]
+                suffix = "/{}".format(filename.lstrip("/"))
+                VaultIndex._suffix_index[filename] = [
+                    filepath for filepath in VaultIndex._index.get(basename, [])
+                    if filepath.endswith(suffix)
+                ]
+            filepaths = VaultIndex._suffix_index[filename]
         else:
-            for filepath in VaultIndex._index:
-                if "/{}".format(filename) in filepath:
-                    return filepath
+            filepaths = VaultIndex._index.get(filename, [])
+
+        if not filepaths:
+            return None
+        if len(filepaths) > 1:
+            VaultIndex.report_ambiguous(filename, filepaths)
+        return filepaths[0]
+
+
+    @staticmethod
+    def report_ambiguous(filename, filepaths):
+        '''
+        warn about an ambiguous filename, once per run (a note is
+        often looked up several times, e.g. on every add)
+        '''
+        with VaultIndex._lock:
+            if filename in VaultIndex._reported_ambiguous:
+                return
+            VaultIndex._reported_ambiguous.add(filename)
+        VaultIndex._log.warning("ambiguous filename \"{}\" matches {} files: {}".format(
+                                filename, len(filepaths), ", ".join(filepaths)))
+
+
+    @staticmethod
+    def get_ambiguous_filenames():
+        '''
+        return a dict of filename -> filepaths for every filename
+        that appears more than once in the vault
+        '''
+        if VaultIndex._index is None or VaultIndex._expired:
+            VaultIndex.load()
+        return {
+            filename: filepaths for filename, filepaths in VaultIndex._index.items()
+            if len(filepaths) > 1
+        }
 
 
 
@@ -57,7 +418,25 @@ class Note:
     
     this class represents that markdown file and all of it's 
     reduced forms, known as "ankinote chunks" or "chunk styles"
+
+    a snapshot can hold tens of thousands of Notes, so a Note is
+    kept small (__slots__, one class-level logger) and cheap: its
+    filepath and its card back are only looked up the first time
+    they are needed, which a summary never does
     '''
+
+    __slots__ = (
+        'title',
+        'source',
+        'anki_id',
+        'ankinote_filepath',
+        'ankinote_card_back',
+        '_filepath',
+        '_card_back',
+    )
+
+    log = logging.getLogger("Note")
+
     def __init__(self, title, source=None, **kwargs):
         '''
         the "source" should one of: 
@@ -73,31 +452,60 @@ class Note:
         - content (the "back of the card")
         - obsidian_to_anki_id (may be present, may be None)
         '''
-        self.log = logging.getLogger(self.__class__.__name__)
-
-        self.anki_card_tag = Config.get_config_item("anki_card_tag")
-
         self.title = title
-        self.filename = self.title + ".md"
-        self.filepath = self.locate_note()
-        
         self.source = source
+        self._filepath = UNRESOLVED
+        self._card_back = None
         
         if self.source == "ankinote":
             self.anki_id = kwargs['ankinote']['obsidian_to_anki_id']
             # this either:
             # - sets self.anki_id to "None"
             # - sets self.anki_id to something like "<!--ID: 1685461928651-->"
+            self.ankinote_filepath = kwargs['ankinote']['filepath']
+            self.ankinote_card_back = kwargs['ankinote']['card_back']
+            # what the entry in the ankinote currently says
 
         if self.source == "markdown_file":
             self.anki_id = None
+            self.ankinote_filepath = None
+            self.ankinote_card_back = None
+
+
+    @property
+    def filename(self):
+        return self.title + ".md"
+
+
+    @property
+    def filepath(self):
+        if self._filepath is UNRESOLVED:
+            self._filepath = self.locate_note()
+        return self._filepath
+
+
+    @property
+    def card_back(self):
+        if self._card_back is None:
+            self._card_back = self.get_first_line()
+        return self._card_back
+
+
+    @property
+    def anki_card_tag(self):
+        return Config.get_config_item("anki_card_tag")
 
 
     def locate_note(self):
         return VaultIndex.get_note_filepath(self.filename)
 
 
-    def chunk_style_first_line(self, delete=None):
+    def chunk_style_first_line(self, delete=None, as_is=False):
+        '''
+        render the chunk for this note. with as_is, an ankinote note is
+        rendered from what its entry in the ankinote says, instead of
+        from its file (so nothing is looked up or read)
+        '''
 
         from ankibox.chunks import ankinote_chunk_first_line
         from ankibox.chunks import ankinote_chunk_first_line_with_id
@@ -107,40 +515,21 @@ class Note:
         # from chunks import ankinote_chunk_first_line_with_id
         # from chunks import ankinote_chunk_first_line_delete
 
-        self.delete = delete
-
-        if self.delete:
+        if delete:
             first_line = "note is being removed from ankinote"
+        elif as_is:
+            first_line = self.ankinote_card_back
         else:
-            with open(self.filepath, 'r') as f:
-                filelines = f.readlines()
-                # now find the first non-blank line
-                for line in filelines:
-                    # my notes tend to start with a couple of blank lines
-                    # which means the first list items after reading the
-                    # note with readlines() are newline characters.
-                    # so if "\n" is the first list item, keep looking
-                    # through the list for some actual text...
-                    if line == "\n" or line == "```\n":
-                        continue
-                    # also, sometimes the first text is "related:" followed
-                    # by a bullet list of notes. so if "related:" is found,
-                    # then skip ahead to the next item which will be the name
-                    # of another note, aka something more interesting.
-                    elif line.startswith("related:"):
-                        continue
-                    else:
-                        first_line = line.strip()
-                        break
-
-        filepath = self.filepath
+            first_line = self.card_back
+
+        filepath = self.ankinote_filepath if as_is else self.filepath
         front = self.title
         back = first_line
         tag = self.anki_card_tag
 
         # which template to use?
         #
-        if self.delete:
+        if delete:
             template = ankinote_chunk_first_line_delete
             chunk = template.format(
                 filepath=filepath,
@@ -171,6 +560,77 @@ class Note:
             return chunk
 
 
+    def get_first_line(self):
+        '''
+        the first line of the note, from the CardBackCache if the
+        note hasn't changed since it was last read
+        '''
+        fingerprint = get_fingerprint(self.filepath)
+        first_line = CardBackCache.get(self.filepath, fingerprint)
+        if first_line is None:
+            first_line = self.read_first_line()
+            CardBackCache.put(self.filepath, fingerprint, first_line)
+        elif Profiler.enabled:
+            Profiler.count("card back cache hits")
+        return first_line
+
+
+    def read_first_line(self):
+        '''
+        stream the note line by line and stop at the first meaningful line
+
+        at most "card_back_read_limit" bytes (from the config) are read,
+        so a huge note (e.g. a clipping full of base64 images) costs no
+        more than a small one. if the limit is hit, whatever was read of
+        the current line is used and a warning is logged
+        '''
+        read_limit = Config.get_optional_config_item("card_back_read_limit", 65536)
+        bytes_read = 0
+        first_line = ""
+        if Profiler.enabled:
+            Profiler.count("notes read")
+        with open(self.filepath, 'rb') as f:
+            while bytes_read < read_limit:
+                raw_line = f.readline(read_limit - bytes_read)
+                if not raw_line:
+                    break
+                bytes_read += len(raw_line)
+                truncated = not raw_line.endswith(b"\n") and bytes_read >= read_limit
+                line = raw_line.replace(b"\r\n", b"\n").decode("utf-8", errors="replace")
+                # my notes tend to start with a couple of blank lines
+                # so if the line is just a newline character, keep
+                # reading through the file for some actual text...
+                if line == "\n" or line == "```\n":
+                    continue
+                # also, sometimes the first text is "related:" followed
+                # by a bullet list of notes. so if "related:" is found,
+                # then skip ahead to the next line which will be the name
+                # of another note, aka something more interesting.
+                elif line.startswith("related:"):
+                    continue
+                else:
+                    first_line = line.strip()
+                    if truncated:
+                        self.log.warning("read limit of {} bytes hit in \"{}\", card back is truncated".format(
+                                         read_limit, self.filepath))
+                    return first_line
+        if bytes_read >= read_limit:
+            self.log.warning("read limit of {} bytes hit in \"{}\" before finding a first line".format(
+                             read_limit, self.filepath))
+        return first_line
+
+
+    def matches_ankinote_entry(self):
+        '''
+        would rendering this (ankinote) note give the same chunk
+        that is already in the ankinote?
+        '''
+        return (
+            str(self.filepath) == self.ankinote_filepath
+            and self.card_back == self.ankinote_card_back
+        )
+
+
     def chunk_style_first_heading(self):
         pass
 
@@ -195,6 +655,13 @@ class File:
         self.log.debug("initialized Source (File) for \"{}\"".format(self.name))
 
 
+    def get_fingerprint(self):
+        '''
+        the snapshot of a File only depends on its content
+        '''
+        return get_fingerprint(self.source_path)
+
+
 
 
 class IWQueue(File):
@@ -209,7 +676,8 @@ class IWQueue(File):
     def __init__(self, config):
         super().__init__(config)
         self.iw_queue_header_length = 7
-        # HARDCODED VALUE... IW queue file headers are 7 lines
+        # fallback only: the header is found by looking for the
+        # table's separator row, see find_header_end()
 
 
     def extract_note_title(self, line):
@@ -221,23 +689,83 @@ class IWQueue(File):
         return note_title
 
 
-    def get_snapshot(self):
+    def find_header_end(self, data):
         '''
-        a snapshot is a list of Note objects
+        the byte offset where the rows of the queue start
+
+        the header is the frontmatter plus the table's column names,
+        and ends with the table's separator row ("|------|------|...").
+        if there is no separator row near the top of the file, the
+        header is assumed to be the usual 7 lines
         '''
-        with open(self.source_path, "r") as f:
-            filelines = f.readlines()
+        offset = 0
+        for line in data.splitlines(keepends=True)[:64]:
+            offset += len(line)
+            stripped = line.strip()
+            if stripped.startswith(b"|") and b"-" in stripped and not stripped.strip(b"|-: "):
+                return offset
+
+        self.log.debug("no table separator found in \"{}\", assuming a {} line header".format(
+                       self.name, self.iw_queue_header_length))
+        offset = 0
+        for line in data.splitlines(keepends=True)[:self.iw_queue_header_length]:
+            offset += len(line)
+        return offset
+
+
+    def parse_rows(self, data):
+        '''
+        the note titles in some (complete) rows of the queue
+        '''
+        return [
+            self.extract_note_title(line)
+            for line in data.decode().splitlines()
+            if line.strip()
+        ]
 
-        item_count = len(filelines) - self.iw_queue_header_length
-        self.log.debug("{} items found in \"{}\"".format(item_count, self.name))
 
-        iw_queue_body = filelines[self.iw_queue_header_length:]
+    def get_snapshot(self):
+        '''
+        a snapshot is a (columnar) sequence of Note objects
 
-        notes = []
-        for line in iw_queue_body:
-            title = self.extract_note_title(line)
-            notes.append(Note(title, source="markdown_file"))
-        return notes
+        the rows parsed on earlier runs come from the IWQueueCache
+        for as long as the start of the file is unchanged, so only
+        rows appended since then are parsed. the last row is never
+        cached until it ends with a newline (it may still be written)
+        '''
+        with open(self.source_path, "rb") as f:
+            data = f.read()
+
+        titles = None
+        cached = IWQueueCache.get(self.source_path)
+        if cached and cached['offset'] <= len(data):
+            checksum = hashlib.blake2b(memoryview(data)[:cached['offset']]).hexdigest()
+            if checksum == cached['checksum']:
+                titles = list(cached['titles'])
+                offset = cached['offset']
+                Profiler.count("iw queue rows reused", len(titles))
+        if titles is None:
+            self.log.debug("parsing \"{}\" from the start".format(self.name))
+            titles = []
+            offset = self.find_header_end(data)
+
+        complete = data.rfind(b"\n", offset) + 1 or offset
+        titles += self.parse_rows(data[offset:complete])
+        IWQueueCache.put(
+            self.source_path,
+            complete,
+            hashlib.blake2b(memoryview(data)[:complete]).hexdigest(),
+            titles,
+        )
+        titles = titles + self.parse_rows(data[complete:])
+        Profiler.count("iw queue bytes parsed", len(data) - offset)
+
+        self.log.debug("{} items found in \"{}\"".format(len(titles), self.name))
+
+        notes = Snapshot("markdown_file")
+        for title in titles:
+            notes.append(title)
+        return notes.freeze()
 
 
 
@@ -256,19 +784,29 @@ class Folder:
         self.log.debug("initialized Source (Folder) for \"{}\"".format(self.name))
 
 
+    def get_fingerprint(self):
+        '''
+        the snapshot of a Folder only depends on which files are in it
+        '''
+        return get_fingerprint(self.source_path)
+
+
     def get_snapshot(self):
         '''
-        a snapshot is a list of Note objects
+        a snapshot is a (columnar) sequence of Note objects
         '''
-        md_files = [file for file in os.listdir(self.source_path) if file.endswith('.md')]
+        md_files = [
+            entry.name for entry in scan_directory(self.source_path)
+            if not entry.is_dir and entry.name.endswith('.md')
+        ]
         item_count = len(md_files)
         self.log.debug("{} items found in \"{}\"".format(item_count, self.name))
 
-        notes = []
+        notes = Snapshot("markdown_file")
         for file in md_files:
             title = file[:-3] # remove ".md" file extension
-            notes.append(Note(title, source="markdown_file"))
-        return notes
+            notes.append(title)
+        return notes.freeze()
 
 
 
@@ -293,6 +831,7 @@ class AnkiNote:
         self.log.debug("initializing AnkiNote for \"{}\"...".format(self.name))
         self.source_path = config['path']
         self.source_type = source_type
+        self.write_count = 0
 
         if self.check_for_existing_ankinote():
             pass
@@ -328,6 +867,15 @@ class AnkiNote:
                 return False
 
 
+    def get_fingerprint(self):
+        '''
+        the ankinote's (mtime_ns, size), plus a count of the writes made
+        through this object, so a write always changes the fingerprint
+        even if the file system's mtime resolution is coarse
+        '''
+        return (get_fingerprint(self.ankinote_path), self.write_count)
+
+
     def create_ankinote(self):
         self.log.debug("created an AnkiNote for \"{}\" (NOT REALLY THOUGH)".format(self.name))
         # TODO: add a debug print log, one that says "created ankinote: /path/goes/here/or/something"
@@ -335,81 +883,52 @@ class AnkiNote:
 
     def get_snapshot(self):
         '''
-        a snapshot is a list of Note objects
+        a snapshot is a (columnar) sequence of Note objects
         '''
+        return self.build_snapshot([self.read_entries(self.ankinote_path)])
 
-        if os.path.isfile(self.ankinote_path):
-            pass
-        else:
-            self.log.debug("can't snapshot a file that doesn't exist yet!")
-            return []
-        
-        with open(self.ankinote_path, "r") as f:
-            filelines = f.readlines()
-        
-        if len(filelines) == 0:
-            self.log.debug("the ankinote is empty!")
-            return []
-
-        notes = []
-        with open(self.ankinote_path, "r") as f:
-            filestring = f.read()
-        ankinote_entries = filestring.split("---\n")
 
-        ankinote_entries = ankinote_entries[1:-1]
-        # [1:-1] list slice is to cut off the first and last items
-        # the first is the ANKINOTE_HEADER section
-        # the last is a couple of blank lines after the final --- divider
-        
-        self.log.debug("{} items found in \"{}\"".format(len(ankinote_entries), self.name))
+    def read_entries(self, path):
+        '''
+        the entries of the ankinote (or shard) at path
+        '''
+        try:
+            with open(path, "r") as f:
+                return list(parse_ankinote(f, self.anki_card_tag, name=path))
+        except FileNotFoundError:
+            self.log.debug("can't snapshot a file that doesn't exist yet! ({})".format(path))
+            return []
 
-        for entry in ankinote_entries:
 
-            details = {}
-            details['filepath'] = self.extract_filepath_from_ankinote_entry(entry)
-            details['filename'] = self.extract_filename_from_filepath(details['filepath'])
-            details['card_front'] = self.extract_card_front_from_ankinote_entry(entry)
-            details['card_back'] = self.extract_card_back_from_ankinote_entry(entry)
-            details['obsidian_to_anki_id'] = self.extract_obsidian_to_anki_id_from_ankinote_entry(entry)
+    def build_snapshot(self, entry_lists):
+        '''
+        a snapshot of the entries read from one or more files, in order
+        '''
+        notes = Snapshot("ankinote")
+        for entries in entry_lists:
+            for entry in entries:
+                notes.append(
+                    entry.card_front,
+                    filepath=entry.filepath,
+                    card_back=entry.card_back,
+                    obsidian_to_anki_id=entry.obsidian_to_anki_id,
+                )
+        notes.freeze()
+
+        if len(notes) == 0:
+            self.log.debug("the ankinote is empty!")
 
-            title = details['card_front']
-            ankinote_entry = {'ankinote': details}
-            notes.append(Note(title, source="ankinote", **ankinote_entry))
+        self.log.debug("{} items found in \"{}\"".format(len(notes), self.name))
+        Profiler.count("ankinote entries parsed", len(notes))
 
         return notes
 
-    def extract_filepath_from_ankinote_entry(self, entry):
-        entry_lines = entry.split("\n")
-        for line in entry_lines:
-            if line.startswith("filepath:"):
-                return line.split(":")[1].strip()
-
-    def extract_filename_from_filepath(self, path):
-        return path.split("/")[-1]
-
-    def extract_card_front_from_ankinote_entry(self, entry):
-        entry_lines = entry.split("\n")
-        for line in entry_lines:
-            if line.endswith(self.anki_card_tag):
-                return line.removesuffix(self.anki_card_tag).strip()
-
-    def extract_card_back_from_ankinote_entry(self, entry):
-        entry_lines = entry.split("\n")
-        card_front_index = None
-        for index, line in enumerate(entry_lines):
-            if line.endswith(self.anki_card_tag):
-                card_front_index = index
-                break
-        return entry_lines[card_front_index + 1]
-
-    def extract_obsidian_to_anki_id_from_ankinote_entry(self, entry):
-        entry_lines = entry.split("\n")
-        for line in entry_lines:
-            if line.startswith("<!--ID:"):
-                return line.strip()
-
-
-    def write_chunks_to_ankinote(self, chunks):
+
+    def write_chunks_to_ankinote(self, chunks, titles):
+        '''
+        titles are the card fronts of the chunks (which a
+        ShardedAnkiNote places them by)
+        '''
         self.log.debug("writing chunks to ankinote...")
         #
         # this is a relatively dumb function
@@ -421,14 +940,225 @@ class AnkiNote:
         from ankibox.chunks import ankinote_chunk_header
         # from chunks import ankinote_chunk_header
 
-        with open (self.ankinote_path, "w") as f:
-            f.write(ankinote_chunk_header.format(ankibox_name=self.name))
-            for chunk in chunks:
-                f.write(chunk)
+        header = ankinote_chunk_header.format(ankibox_name=self.name)
+        with Profiler.phase(self.name, "write ankinote"):
+            write_atomically(self.ankinote_path, [header] + list(chunks))
+        Profiler.count("chunks written", len(chunks))
+        self.write_count += 1
         
         self.log.debug("done.")
 
 
+    def can_append_to_ankinote(self):
+        '''
+        chunks can only be appended to an ankinote that exists and
+        ends with a divider (i.e. has nothing trailing its last entry)
+        '''
+        return bool(ends_with_divider(self.ankinote_path))
+
+
+    def append_chunks_to_ankinote(self, chunks, titles):
+        self.log.debug("appending chunks to ankinote...")
+        with Profiler.phase(self.name, "append to ankinote"):
+            append_durably(self.ankinote_path, chunks)
+        Profiler.count("chunks written", len(chunks))
+        self.write_count += 1
+        self.log.debug("done.")
+
+
+    def get_paths(self):
+        '''
+        the file(s) the ankinote is stored in
+        '''
+        return [self.ankinote_path]
+
+
+
+
+class ShardedAnkiNote(AnkiNote):
+    '''
+    an AnkiNote split across several files, for very large ankiboxes
+
+    with "shards = <n>" in an ankibox's config, its entries are spread
+    over n files next to where the ankinote would be, e.g.
+    ankibox/ANKIBOX.0.md ... ankibox/ANKIBOX.<n-1>.md, each with the
+    same TARGET DECK header. an entry's shard is picked by a hash of
+    its title, so it always lands in the same shard
+
+    the shards are read in parallel, and a write only touches the
+    shards whose content actually changes (so the Obsidian_to_Anki
+    plugin has fewer files to rescan, too)
+
+    an existing unsharded ankinote is still read, and is removed the
+    first time the whole ankinote is written out to the shards. so
+    are shards beyond the configured count, left by a config that had
+    more of them (with "shards = 1" the one shard is the unsharded
+    ankinote itself, so that's how an ankibox goes back to one file)
+    '''
+    def __init__(self, config, source_type):
+        self.shard_count = config.get('shards', 1)
+        super().__init__(config, source_type)
+        if self.shard_count > 1:
+            base = self.ankinote_path.removesuffix(".md")
+            self.shard_paths = ["{}.{}.md".format(base, n) for n in range(self.shard_count)]
+        else:
+            self.shard_paths = [self.ankinote_path]
+        self.shard_digests = {}
+        self.old_paths = [path for path in self.find_shards(self.ankinote_path) if path not in self.shard_paths]
+        if self.ankinote_path not in self.shard_paths:
+            self.old_paths.append(self.ankinote_path)
+        if self.old_paths:
+            self.log.debug("old ankinote files for \"{}\": {}".format(self.name, self.old_paths))
+        self.log.debug("{} shards for \"{}\"".format(self.shard_count, self.name))
+
+
+    @staticmethod
+    def find_shards(ankinote_path):
+        '''
+        the shard files that exist for an ankinote, in shard order
+        '''
+        base = ankinote_path.removesuffix(".md")
+        shards = []
+        for path in glob.glob("{}.*.md".format(glob.escape(base))):
+            n = path[len(base) + 1:-len(".md")]
+            if n.isdigit():
+                shards.append((int(n), path))
+        return [path for n, path in sorted(shards)]
+
+
+    def get_shard(self, title):
+        '''
+        the shard for a title (stripped, like the card front it is
+        read back as)
+        '''
+        digest = hashlib.blake2b(title.strip().encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.shard_count
+
+
+    def get_shards(self, chunks, titles, header=None):
+        '''
+        the chunks for each shard (after the header, if given)
+        '''
+        shards = [[header] if header else [] for _ in range(self.shard_count)]
+        for chunk, title in zip(chunks, titles):
+            shards[self.get_shard(title)].append(chunk)
+        return shards
+
+
+    def get_paths(self):
+        return self.shard_paths + self.old_paths
+
+
+    def get_fingerprint(self):
+        return (tuple(get_fingerprint(path) for path in self.get_paths()), self.write_count)
+
+
+    def read_entries(self, path):
+        '''
+        the entries of the shard at path, recording a digest of its
+        content (see holds)
+        '''
+        fingerprint = get_fingerprint(path)
+        try:
+            with open(path, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            self.shard_digests.pop(path, None)
+            return []
+        self.shard_digests[path] = (fingerprint, self.get_digest(content))
+        return list(parse_ankinote(io.StringIO(content), self.anki_card_tag, name=path))
+
+
+    @staticmethod
+    def get_digest(content):
+        return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+    def holds(self, path, digest):
+        '''
+        does the shard at path already hold the content with this
+        digest? the digest recorded when the shard was last read or
+        written is trusted while the shard's fingerprint is unchanged
+        (and not racy), otherwise the shard is read again
+        '''
+        fingerprint = get_fingerprint(path)
+        recorded = self.shard_digests.get(path)
+        if recorded and recorded[0] == fingerprint and not is_racy(fingerprint):
+            return recorded[1] == digest
+        Profiler.count("ankinote shards read back")
+        try:
+            with open(path, "r") as f:
+                return self.get_digest(f.read()) == digest
+        except FileNotFoundError:
+            return False
+
+
+    def get_snapshot(self):
+        '''
+        a snapshot is a (columnar) sequence of Note objects
+        '''
+        io_jobs = Config.get_optional_config_item("io_jobs", 8)
+        with ThreadPoolExecutor(max_workers=max(1, io_jobs)) as executor:
+            return self.build_snapshot(executor.map(self.read_entries, self.get_paths()))
+
+
+    def write_chunks_to_ankinote(self, chunks, titles):
+        from ankibox.chunks import ankinote_chunk_header
+
+        header = ankinote_chunk_header.format(ankibox_name=self.name)
+        shards = self.get_shards(chunks, titles, header)
+
+        written = 0
+        with Profiler.phase(self.name, "write ankinote"):
+            for path, strings in zip(self.shard_paths, shards):
+                content = "".join(strings)
+                digest = self.get_digest(content)
+                if self.holds(path, digest):
+                    continue
+                write_atomically(path, [content])
+                self.shard_digests[path] = (get_fingerprint(path), digest)
+                written += 1
+            for path in self.old_paths:
+                if os.path.exists(path):
+                    self.log.info("entries moved into shards, removing \"{}\"".format(path))
+                    os.remove(path)
+
+        self.log.debug("{} of {} shards written".format(written, self.shard_count))
+        Profiler.count("chunks written", len(chunks))
+        Profiler.count("ankinote shards written", written)
+        self.write_count += 1
+
+
+    def can_append_to_ankinote(self):
+        '''
+        every shard that exists has to end with a divider (and there
+        must be no unsharded ankinote, or old shards, left to move into
+        the shards)
+        '''
+        if any(os.path.exists(path) for path in self.old_paths):
+            return False
+        return all(ends_with_divider(path) is not False for path in self.shard_paths)
+
+
+    def append_chunks_to_ankinote(self, chunks, titles):
+        from ankibox.chunks import ankinote_chunk_header
+
+        shards = self.get_shards(chunks, titles)
+
+        with Profiler.phase(self.name, "append to ankinote"):
+            for path, shard_chunks in zip(self.shard_paths, shards):
+                if not shard_chunks:
+                    continue
+                self.shard_digests.pop(path, None)
+                if os.path.exists(path):
+                    append_durably(path, shard_chunks)
+                else:
+                    header = ankinote_chunk_header.format(ankibox_name=self.name)
+                    write_atomically(path, [header] + shard_chunks)
+        Profiler.count("chunks written", len(chunks))
+        self.write_count += 1
+
+
 
 
 
@@ -458,99 +1188,142 @@ class AnkiBox:
         self.action = action
         self.ankinote = ankinote
         self.source = source
+        self.interactive = True
+        self.ankiconnect = None     # an AnkiConnect client, if that's the sync backend
+        self._state_cache = None
+        self._state_racy = False
         self.log.debug("done.")
 
+
+    def run(self):
+        '''
+        carry out the action requested on the command line
+        '''
         self.log.debug("processing command line arguments...")
 
         if self.action.add and self.action.delete:
             self.log.warning("add+delete at the same time: not implemented")
         
         elif self.action.add:
-            self.add_new_notes()
+            with Profiler.phase(self.name, "add"):
+                self.add_new_notes()
         
         elif self.action.delete:
-            self.remove_old_notes()
+            with Profiler.phase(self.name, "delete"):
+                self.remove_old_notes()
         
+        elif self.action.resume_delete:
+            with Profiler.phase(self.name, "resume delete"):
+                self.resume_delete()
+
+        elif self.action.update:
+            with Profiler.phase(self.name, "update"):
+                self.update_notes()
+
         elif self.action.summary:
-            self.summary_short()
+            with Profiler.phase(self.name, "summary"):
+                self.summary_short()
         
         else:
-            self.summary_long()
-            
+            with Profiler.phase(self.name, "summary (long)"):
+                self.summary_long()
+
 
 
 
-    def get_state(self):
+    def get_fingerprint(self):
         '''
-        compiles a dict containing item counts, note titles, and lists of Notes.
-        collectively that represents the current state of the AnkiBox...
+        the fingerprints of the source and the ankinote together
         '''
-        self.log.debug("determining AnkiBox state...")
+        return (self.source.get_fingerprint(), self.ankinote.get_fingerprint())
 
-        snapshot_source = self.source.get_snapshot() ## ahh these are white instead of orange now with the new AnkiBox.init method...
-        snapshot_ankinote = self.ankinote.get_snapshot() ## ahh if i specify the type in the constructor then it's orange again...
 
-        count_source_total = len(snapshot_source)
-        count_ankinote_total = len(snapshot_ankinote)
+    def get_state(self, fingerprint=None):
+        '''
+        snapshot the source and the ankinote and diff them.
+        the returned AnkiBoxState represents the current state of the AnkiBox...
 
-        titles_source_all = []
-        titles_ankinote_all = []
+        (a caller that has just taken the fingerprint can pass it
+        in, rather than have the files stat-ed a second time)
+        '''
+        self.log.debug("determining AnkiBox state...")
 
-        for note in snapshot_source:
-            titles_source_all.append(note.title)
-        for note in snapshot_ankinote:
-            titles_ankinote_all.append(note.title)
+        # the state is memoized for the rest of the run, until the
+        # source or the ankinote changes (e.g. write_chunks_to_ankinote)
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint()
+        if self._state_cache and self._state_cache[0] == fingerprint:
+            self.log.debug("source and ankinote unchanged, reusing state.")
+            return self._state_cache[1]
+
+        with Profiler.phase(self.name, "source snapshot"):
+            snapshot_source = self.source.get_snapshot()
+        with Profiler.phase(self.name, "ankinote snapshot"):
+            snapshot_ankinote = self.ankinote.get_snapshot()
+        with Profiler.phase(self.name, "diff"):
+            state = diff_snapshots(snapshot_source, snapshot_ankinote)
+        self._state_cache = (fingerprint, state)
+        source_fingerprint, (ankinote_fingerprint, _) = fingerprint
+        self._state_racy = is_racy(source_fingerprint, ankinote_fingerprint)
 
-        notes_source_new = []
-        notes_ankinote_old = []
+        self.log.debug("done.")
 
-        for note in snapshot_source:
-            if note.title in titles_ankinote_all:
-                continue
-            else:
-                notes_source_new.append(note)
-        for note in snapshot_ankinote:
-            if note.title in titles_source_all:
-                continue
-            else:
-                notes_ankinote_old.append(note)
-        
-        count_source_new = len(notes_source_new)
-        count_ankinote_old = len(notes_ankinote_old)
+        return state
 
-        titles_source_new = []
-        titles_ankinote_old = []
 
-        for note in notes_source_new:
-            titles_source_new.append(note.title)
-        for note in notes_ankinote_old:
-            titles_ankinote_old.append(note.title)
-        
-        count_ankinote_anki_ids = 0
-        for note in snapshot_ankinote:
-            if note.anki_id:
-                count_ankinote_anki_ids += 1
-            else:
-                continue
+    def expire_state(self):
+        '''
+        forget the memoized state if it was computed from a racy
+        fingerprint: a change made in the same mtime "tick" wouldn't
+        change the fingerprint, so a long-lived process (the daemon)
+        would keep serving the stale state
+        '''
+        if self._state_racy:
+            self.log.debug("state was computed from a racy fingerprint, forgetting it.")
+            self._state_cache = None
+            self._state_racy = False
 
-        ankibox_state = {}
-        # ankibox_state['snapshot_source'] = snapshot_source
-        ankibox_state['snapshot_ankinote'] = snapshot_ankinote                      # add, remove
-        ankibox_state['count_source_total'] = count_source_total                    # summary
-        ankibox_state['count_ankinote_total'] = count_ankinote_total                # summary
-        ankibox_state['titles_source_all'] = titles_source_all                      # remove
-        # ankibox_state['titles_ankinote_all'] = titles_ankinote_all
-        ankibox_state['count_source_new'] = count_source_new                        # summary, add
-        ankibox_state['count_ankinote_old'] = count_ankinote_old                    # summary, remove
-        ankibox_state['titles_source_new'] = titles_source_new                      # summary
-        ankibox_state['titles_ankinote_old'] = titles_ankinote_old                  # summary
-        ankibox_state['notes_source_new'] = notes_source_new                        # add
-        # ankibox_state['notes_ankinote_old'] = notes_ankinote_old
-        ankibox_state['count_ankinote_anki_ids'] = count_ankinote_anki_ids          # summary
 
-        self.log.debug("done.")
+    def get_summary_fingerprint(self, fingerprint=None):
+        '''
+        everything the new / old counts depend on: which source and
+        ankinote this is, and their fingerprints on disk
+        '''
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint()
+        source_fingerprint, (ankinote_fingerprint, _) = fingerprint
+        return (
+            self.source.source_path,
+            source_fingerprint,
+            self.ankinote.ankinote_path,
+            ankinote_fingerprint,
+        )
 
-        return ankibox_state
+
+    def get_summary_counts(self):
+        '''
+        the (new, old) counts, straight from the SummaryCache if
+        neither the source nor the ankinote changed since last time
+        '''
+        fingerprint = self.get_fingerprint()
+        summary_fingerprint = self.get_summary_fingerprint(fingerprint)
+        counts = SummaryCache.get(self.name, summary_fingerprint)
+        if counts is not None:
+            self.log.debug("source and ankinote unchanged, reusing summary.")
+            Profiler.count("summary cache hits")
+            return counts
+
+        state = self.get_state(fingerprint)
+        counts = (state.count_source_new, state.count_ankinote_old)
+        # a change made in the same mtime "tick" as the fingerprint
+        # wouldn't change it, so counts for a source or ankinote that
+        # was changed only just now aren't cached (yet)
+        source_fingerprint, (ankinote_fingerprint, _) = fingerprint
+        if is_racy(source_fingerprint, ankinote_fingerprint):
+            self.log.debug("source or ankinote changed too recently to cache the summary.")
+        else:
+            SummaryCache.put(self.name, summary_fingerprint, counts)
+        return counts
 
 
     def summary_short(self):
@@ -558,9 +1331,7 @@ class AnkiBox:
         print summary of ankibox state (new / old numbers only)
         '''
         self.log.debug("printing summary (new shorter version of short")
-        state = self.get_state()
-        count_source_new = state['count_source_new']
-        count_ankinote_old = state['count_ankinote_old']
+        count_source_new, count_ankinote_old = self.get_summary_counts()
 
         clrz = {}
         clrz['GREEN'] = '\033[92m'
@@ -609,13 +1380,13 @@ class AnkiBox:
         self.log.debug("printing summary (long)")
         self.print_divider(self.name)
         state = self.get_state()
-        count_source_new = state['count_source_new']
-        count_ankinote_old = state['count_ankinote_old']
-        count_source_total = state['count_source_total']
-        count_ankinote_total = state['count_ankinote_total']
-        count_ankinote_anki_ids = state['count_ankinote_anki_ids']
-        titles_source_new = state['titles_source_new']
-        titles_ankinote_old = state['titles_ankinote_old']
+        count_source_new = state.count_source_new
+        count_ankinote_old = state.count_ankinote_old
+        count_source_total = state.count_source_total
+        count_ankinote_total = state.count_ankinote_total
+        count_ankinote_anki_ids = state.count_ankinote_anki_ids
+        titles_source_new = state.titles_source_new
+        titles_ankinote_old = state.titles_ankinote_old
         print("")
         print("{} new notes found in \"{}\" source".format(count_source_new, self.name))
         print("{} old notes found in \"{}\" ankinote".format(count_ankinote_old, self.name))
@@ -657,22 +1428,38 @@ class AnkiBox:
 
 
 
+    def locate_notes(self, notes):
+        '''
+        the notes to add that can be found in the vault. a note that
+        can't (e.g. renamed since the source listed it) has no card
+        back to add, so it is left out, with a warning
+        '''
+        with Profiler.phase(self.name, "locate notes"):
+            filepaths = self.map_notes(operator.attrgetter('filepath'), notes)
+        for note, filepath in zip(notes, filepaths):
+            if filepath is None:
+                self.log.warning("\"{}\" not found in the vault, not added".format(note.title))
+        return tuple(note for note, filepath in zip(notes, filepaths) if filepath is not None)
+
+
     def add_new_notes(self):
         '''
         the add operation
         '''
+        if self.ankiconnect:
+            return self.add_new_notes_ankiconnect()
+
         self.log.debug("starting add operation")
         self.summary_long()
 
         # step 1: get ankibox state
         state = self.get_state()
-        ankinote_snapshot = state['snapshot_ankinote']
-        notes_source_new = state['notes_source_new']
-        count_source_new = state['count_source_new']
+        ankinote_snapshot = state.snapshot_ankinote
+        notes_source_new = self.locate_notes(state.notes_source_new)
 
         # step 2: check for new notes to add
         self.log.debug("checking source for new notes...")
-        if count_source_new:
+        if notes_source_new:
             self.log.debug("there are new notes to be added.")
         else:
             self.log.debug("no new notes to add.")
@@ -681,23 +1468,33 @@ class AnkiBox:
             print("no action taken.")
             return
 
-        # step 3: compile chunks for ankinote
-        chunks = []
-        for note in notes_source_new:
-            # gather the new notes in the source...
-            chunks.append(note.chunk_style_first_line())
-        for note in ankinote_snapshot:
-            # ...and all the existing notes in the ankinote.
-            chunks.append(note.chunk_style_first_line())
-
-        # step 4: write the ankinote
-        self.ankinote.write_chunks_to_ankinote(chunks)
+        # step 3: check whether any existing ankinote entries would change.
+        #         (card backs come from the CardBackCache, so this only
+        #         reads notes that were edited since they were last read)
+        self.log.debug("checking existing ankinote entries for changes...")
+        with Profiler.phase(self.name, "check existing entries"):
+            existing_unchanged = all(self.map_notes(Note.matches_ankinote_entry, ankinote_snapshot))
+
+        if existing_unchanged and self.ankinote.can_append_to_ankinote():
+            # step 4a: nothing else changed, so just append the new notes
+            self.log.debug("existing entries unchanged, appending new notes only.")
+            chunks = self.render_chunks(notes_source_new)
+            self.ankinote.append_chunks_to_ankinote(chunks, [note.title for note in notes_source_new])
+        else:
+            # step 4b: compile chunks for ankinote
+            #          from all the existing notes in the ankinote...
+            #          ...and then the new notes in the source (the
+            #          same order an append gives). and rewrite the
+            #          whole thing
+            notes = tuple(ankinote_snapshot) + notes_source_new
+            chunks = self.render_chunks(notes)
+            self.ankinote.write_chunks_to_ankinote(chunks, [note.title for note in notes])
 
         # step 5: prompt the user to run the Obsidian_to_Anki plugin
         self.action_required_prompt("add operation completed, go run Obsidian_to_Anki plugin!")
 
         # boom, add operation is done
-        print("added {} new notes.".format(count_source_new))
+        print("added {} new notes.".format(len(notes_source_new)))
         print("add operation completed.")
 
     
@@ -705,20 +1502,22 @@ class AnkiBox:
         '''
         the delete operation
         '''
+        if self.ankiconnect:
+            return self.remove_old_notes_ankiconnect()
+
         self.log.debug("starting delete operation")
         self.summary_long()
 
         # step 1: get ankibox state
         state = self.get_state()
-        ankinote_snapshot = state['snapshot_ankinote']
-        titles_source_all = state['titles_source_all']
-        count_ankinote_old = state['count_ankinote_old']
+        ankinote_snapshot = state.snapshot_ankinote
+        titles_source_all = state.titles_source_all
+        count_ankinote_old = state.count_ankinote_old
         
         # step 2: check for old notes to delete
         self.log.debug("checking ankinote for old notes...")
         if count_ankinote_old:
             self.log.debug("there are old notes to be deleted.")
-            # notes_ankinote_old = state['notes_ankinote_old']
         else:
             self.log.debug("no old notes to delete.")
             self.log.debug("no action taken.")
@@ -728,13 +1527,9 @@ class AnkiBox:
 
         # step 3: check for unfinished add operation
         self.log.debug("checking ankinote for unadded entries...")
-        unadded_entries = 0
-        for note in ankinote_snapshot:
-            if note.anki_id:
-                continue
-            else:
-                unadded_entries +=1
-                self.log.debug("unadded note: {}".format(note.title))
+        unadded_entries = len(state.rows_ankinote_missing_id)
+        for note in state.notes_ankinote_missing_id:
+            self.log.debug("unadded note: {}".format(note.title))
         
         if unadded_entries:
             self.log.debug("found {} notes in ankinote without an ID".format(unadded_entries))
@@ -743,53 +1538,401 @@ class AnkiBox:
             print("cannot continue, finish add operation first by running Obsidian_to_Anki plugin!")
             return
 
-        # step 4: identify which notes will remain in the ankinote
-        self.log.debug("marking ankinote entries that were found in the source...")
-        for note in ankinote_snapshot:
-            if note.title in titles_source_all:
-                note.found_in_source = True
-        
-        # step 5: compile chunks for first ankinote: 
+        # step 4: compile chunks for first ankinote: 
         #         the intermediary one containing "DELETE" statements
         self.log.debug("compiling chunks for intermediary ankinote...")
-        chunks_intermediary = []
-        for note in ankinote_snapshot:
-            try:
-                if note.found_in_source:
-                    # note found in source, so write it into ankinote like it was before
-                    chunks_intermediary.append(note.chunk_style_first_line())
-            except AttributeError:
-                # note was NOT found in source, so write it into ankinote using a "DELETE" chunk
-                chunks_intermediary.append(note.chunk_style_first_line(delete=True))
-        
-        # step 6: write the intermediary ankinote
+        # notes found in source are written into the ankinote like they were before,
+        # notes NOT found in source are written into the ankinote using a "DELETE" chunk
+        deletes = [title not in titles_source_all for title in ankinote_snapshot.titles]
+        chunks_intermediary = self.render_chunks(ankinote_snapshot, deletes)
+
+        # step 5: record the planned delete in the journal, then
+        #         write the intermediary ankinote
+        journal = DeleteJournal()
+        journal.plan(self.name, self.ankinote.ankinote_path, [
+            get_entry_key(ankinote_snapshot.anki_id(row), ankinote_snapshot.titles[row])
+            for row in state.rows_ankinote_old
+        ])
         self.log.debug("writing intermediary ankinote...")
-        self.ankinote.write_chunks_to_ankinote(chunks_intermediary)
+        self.ankinote.write_chunks_to_ankinote(chunks_intermediary, ankinote_snapshot.titles)
+        journal.set_phase(self.name, PHASE_INTERMEDIARY_WRITTEN)
+
+        # steps 6 - 8: wait for the plugin, then write the final ankinote
+        self.finish_delete(journal)
+
 
-        # step 7: prompt the user to run the Obsidian_to_Anki plugin
+    def finish_delete(self, journal):
+        '''
+        the second phase of the delete operation, driven by the
+        journal: once the user has run the Obsidian_to_Anki plugin,
+        write the ankinote again without the journaled entries
+
+        the final ankinote is made from the intermediary one (as it
+        is on disk, after the plugin has run), so it needs no notes
+        looked up or read
+        '''
+        # step 6: prompt the user to run the Obsidian_to_Anki plugin
         self.log.debug("pausing script for user to take external action...")
         message = "run the Obsidian_to_Anki plugin to perform DELETEs before continuing!"
         self.action_required_prompt(message, are_you_sure=True)
-        
-        # step 8: compile chunks for second ankinote: 
+
+        # step 7: compile chunks for second ankinote: 
         #         the final one with old notes removed
         self.log.debug("compiling chunks for final ankinote...")
-        chunks_final = []
-        for note in ankinote_snapshot:
+        entries = journal.get(self.name)['entries']
+        notes = tuple(self.ankinote.get_snapshot())
+        deletes, not_found = self.match_journal_entries(notes, entries)
+        notes_kept = [note for note, delete in zip(notes, deletes) if not delete]
+        with Profiler.phase(self.name, "render chunks"):
+            chunks_final = [note.chunk_style_first_line(as_is=True) for note in notes_kept]
+
+        # step 8: write the final ankinote
+        self.log.debug("writing final ankinote...")
+        titles_kept = [note.title for note in notes_kept]
+        self.ankinote.write_chunks_to_ankinote(chunks_final, titles_kept)
+        ChunkHashCache.retain(self.ankinote.ankinote_path, titles_kept)
+
+        print("removed {} old notes.".format(len(notes) - len(notes_kept)))
+
+        # an entry that isn't in the ankinote any more is as good as
+        # deleted (e.g. a final ankinote written before a crash)
+        for anki_id, title_hash in not_found:
+            self.log.debug("journaled entry {} ({}) already gone from the ankinote".format(
+                           title_hash, anki_id))
+
+        # boom, delete operation is done
+        journal.remove(self.name)
+        print("delete operation completed.")
+
+
+    def match_journal_entries(self, notes, entries):
+        '''
+        find the journaled entries among the notes of the ankinote,
+        by their title hash (one note per entry)
+
+        returns whether each note is one of the entries, and the
+        entries that weren't found
+        '''
+        pending = Counter(title_hash for _, title_hash in entries)
+        deletes = []
+        for note in notes:
+            title_hash = get_title_hash(note.title)
+            if pending[title_hash] > 0:
+                pending[title_hash] -= 1
+                deletes.append(True)
+            else:
+                deletes.append(False)
+
+        not_found = []
+        for entry in entries:
+            if pending[entry[1]] > 0:
+                pending[entry[1]] -= 1
+                not_found.append(entry)
+        return deletes, not_found
+
+
+    def resume_delete(self):
+        '''
+        finish a delete operation that was interrupted, from the journal
+        '''
+        self.log.debug("resuming delete operation")
+        self.print_divider(self.name)
+        print("")
+
+        journal = DeleteJournal()
+        planned = journal.get(self.name)
+        if planned is None:
+            print("no unfinished delete operation for \"{}\".".format(self.name))
+            print("no action taken.")
+            return
+        if planned['ankinote'] != self.ankinote.ankinote_path:
+            self.log.warning("the journaled delete was for \"{}\", not \"{}\"".format(
+                             planned['ankinote'], self.ankinote.ankinote_path))
+            print("no action taken.")
+            return
+
+        notes = tuple(self.ankinote.get_snapshot())
+        deletes, _ = self.match_journal_entries(notes, planned['entries'])
+        if not any(deletes):
+            # the final ankinote was written, but the journal wasn't
+            # removed: there is nothing left to do
+            self.log.debug("no journaled entries left in the ankinote")
+            journal.remove(self.name)
+            print("the old notes were already removed.")
+            print("delete operation completed.")
+            return
+
+        print("resuming the delete of {} old notes ({}).".format(len(planned['entries']), planned['phase']))
+
+        if planned['phase'] == PHASE_PLANNED:
+            # the intermediary ankinote may not have been written:
+            # write it again, from the ankinote itself
+            self.log.debug("writing intermediary ankinote...")
+            chunks_intermediary = [
+                note.chunk_style_first_line(delete=delete, as_is=True)
+                for note, delete in zip(notes, deletes)
+            ]
+            self.ankinote.write_chunks_to_ankinote(chunks_intermediary, [note.title for note in notes])
+            journal.set_phase(self.name, PHASE_INTERMEDIARY_WRITTEN)
+
+        self.finish_delete(journal)
+
+
+    def update_notes(self):
+        '''
+        the update operation: refresh the card backs of the notes
+        already in the ankinote, keeping their IDs
+
+        only entries whose note changed since their chunk was last
+        rendered (see ChunkHashCache) are rendered again, every other
+        entry is written back exactly as it is. the ankinote is only
+        rewritten if at least one entry actually changed
+        '''
+        self.log.debug("starting update operation")
+        self.print_divider(self.name)
+        print("")
+
+        # step 1: get ankibox state
+        state = self.get_state()
+        ankinote_snapshot = state.snapshot_ankinote
+        if not len(ankinote_snapshot):
+            print("no notes in ankinote to update.")
+            print("no action taken.")
+            return
+
+        # step 2: render each entry (again, only if it could be stale)
+        kept = [False] * len(ankinote_snapshot)
+        for row in state.rows_ankinote_kept:
+            kept[row] = True
+        with Profiler.phase(self.name, "render updated chunks"):
+            results = self.map_notes(self.render_updated_chunk, ankinote_snapshot, kept)
+        chunks = [chunk for chunk, _ in results]
+        notes_changed = [note for note, (_, changed) in zip(ankinote_snapshot, results) if changed]
+        ChunkHashCache.retain(self.ankinote.ankinote_path, ankinote_snapshot.titles)
+        ChunkHashCache.save()
+
+        if not notes_changed:
+            print("all {} cards are up to date.".format(len(ankinote_snapshot)))
+            print("no action taken.")
+            return
+
+        print("cards with a new back:")
+        for note in notes_changed:
+            print("- {}".format(note.title))
+        print("")
+
+        # step 3: push the new backs to Anki...
+        if self.ankiconnect:
+            from ankibox.ankiconnect import AnkiConnectError
+
+            anki_ids = ankinote_snapshot.anki_ids
+            cards = [
+                (anki_ids[row], note.title, note.card_back)
+                for row, (note, (_, changed)) in enumerate(zip(ankinote_snapshot, results))
+                if changed and anki_ids[row] > 0
+            ]
             try:
-                if note.found_in_source:
-                    chunks_final.append(note.chunk_style_first_line())
-            except AttributeError:
-                continue
+                with Profiler.phase(self.name, "AnkiConnect update"):
+                    self.ankiconnect.update_notes(cards)
+            except AnkiConnectError as e:
+                self.log.error(e)
+                print("no action taken.")
+                return
 
-        # step 9: write the final ankinote
-        self.log.debug("writing final ankinote...")
-        self.ankinote.write_chunks_to_ankinote(chunks_final)
+        # step 4: ...and write them to the ankinote
+        self.ankinote.write_chunks_to_ankinote(chunks, ankinote_snapshot.titles)
+        if not self.ankiconnect:
+            self.action_required_prompt("update operation completed, go run Obsidian_to_Anki plugin!")
+
+        # boom, update operation is done
+        print("updated {} cards.".format(len(notes_changed)))
+        print("update operation completed.")
+
+
+    def render_updated_chunk(self, note, kept):
+        '''
+        the chunk an ankinote entry should now have, and whether
+        that differs from the one in the ankinote
+
+        entries for notes no longer in the source are left as they
+        are, the delete operation deals with those
+
+        the ChunkHashCache is checked against the file the entry
+        itself names, so an entry that can't be stale costs a stat,
+        and the note is only looked up (in the VaultIndex) and read
+        again when it might be
+        '''
+        chunk_as_is = note.chunk_style_first_line(as_is=True)
+        if not kept:
+            return chunk_as_is, False
+
+        hash_as_is = hashlib.blake2b(chunk_as_is.encode(), digest_size=8).hexdigest()
+        fingerprint = get_fingerprint(note.ankinote_filepath) if note.ankinote_filepath else None
+        if (fingerprint is not None
+                and ChunkHashCache.get(self.ankinote.ankinote_path, note.title) == (fingerprint, hash_as_is)):
+            Profiler.count("chunks known to be up to date")
+            return chunk_as_is, False
+
+        if note.filepath is None:
+            return chunk_as_is, False
+        fingerprint = get_fingerprint(note.filepath)
+        chunk = note.chunk_style_first_line()
+        chunk_hash = hashlib.blake2b(chunk.encode(), digest_size=8).hexdigest()
+        ChunkHashCache.put(self.ankinote.ankinote_path, note.title, fingerprint, chunk_hash)
+        Profiler.count("chunks rendered again")
+        return chunk, chunk != chunk_as_is
+
+
+    def add_new_notes_ankiconnect(self):
+        '''
+        the add operation, done through AnkiConnect: the new notes
+        (and any entries left without an ID by an unfinished add)
+        are added to Anki directly, then written to the ankinote
+        along with the IDs Anki gave them, in a single write
+        '''
+        self.log.debug("starting add operation (AnkiConnect)")
+        self.summary_long()
+
+        # step 1: get ankibox state
+        state = self.get_state()
+        ankinote_snapshot = state.snapshot_ankinote
+        notes_source_new = self.locate_notes(state.notes_source_new)
+        notes_unadded = self.locate_notes(state.notes_ankinote_missing_id)
+        notes_to_add = notes_source_new + notes_unadded
+
+        # step 2: check for new notes to add
+        if not notes_to_add:
+            self.log.debug("no new notes to add.")
+            print("no new notes to add.")
+            print("no action taken.")
+            return
+
+        # step 3: add them to Anki
+        from ankibox.ankiconnect import AnkiConnectError
+
+        with Profiler.phase(self.name, "read card backs"):
+            card_backs = self.map_notes(operator.attrgetter('card_back'), notes_to_add)
+        try:
+            with Profiler.phase(self.name, "AnkiConnect add"):
+                note_ids = self.ankiconnect.add_notes(
+                    self.name, [(note.title, back) for note, back in zip(notes_to_add, card_backs)]
+                )
+        except AnkiConnectError as e:
+            self.log.error(e)
+            print("no action taken.")
+            return
+
+        failed = []
+        for note, note_id in zip(notes_to_add, note_ids):
+            if note_id:
+                note.anki_id = "<!--ID: {}-->".format(note_id)
+            else:
+                failed.append(note.title)
+        for title in failed:
+            self.log.warning("Anki did not accept \"{}\", it is left without an ID".format(title))
+
+        # step 4: write the notes and their IDs to the ankinote
+        with Profiler.phase(self.name, "check existing entries"):
+            existing_unchanged = all(self.map_notes(Note.matches_ankinote_entry, ankinote_snapshot))
+
+        if not notes_unadded and existing_unchanged and self.ankinote.can_append_to_ankinote():
+            chunks = self.render_chunks(notes_source_new)
+            self.ankinote.append_chunks_to_ankinote(chunks, [note.title for note in notes_source_new])
+        else:
+            notes = tuple(ankinote_snapshot) + notes_source_new
+            chunks = self.render_chunks(notes)
+            self.ankinote.write_chunks_to_ankinote(chunks, [note.title for note in notes])
+
+        # boom, add operation is done
+        print("added {} new notes to Anki.".format(len(notes_to_add) - len(failed)))
+        print("add operation completed.")
+
+
+    def remove_old_notes_ankiconnect(self):
+        '''
+        the delete operation, done through AnkiConnect: the old
+        notes are deleted from Anki directly, so the ankinote only
+        has to be written once, without them (no intermediary
+        ankinote of DELETE chunks, no waiting on the plugin)
+        '''
+        self.log.debug("starting delete operation (AnkiConnect)")
+        self.summary_long()
+
+        # step 1: get ankibox state
+        state = self.get_state()
+        anki_ids = state.snapshot_ankinote.anki_ids
+        count_ankinote_old = state.count_ankinote_old
+
+        # step 2: check for old notes to delete
+        if not count_ankinote_old:
+            self.log.debug("no old notes to delete.")
+            print("no old notes to delete.")
+            print("no action taken.")
+            return
+
+        # step 3: collect their IDs (entries without one were never
+        #         added to Anki, so there is nothing to delete there)
+        note_ids = [anki_ids[row] for row in state.rows_ankinote_old if anki_ids[row] > 0]
+        odd_ids = [row for row in state.rows_ankinote_old if anki_ids[row] < 0]
+        if odd_ids:
+            for row in odd_ids:
+                self.log.debug("unreadable ID: {}".format(state.snapshot_ankinote.anki_id(row)))
+            print("found {} old notes with an unreadable ID".format(len(odd_ids)))
+            print("no action taken.")
+            return
+
+        # step 4: delete them from Anki
+        from ankibox.ankiconnect import AnkiConnectError
+
+        self.action_required_prompt("about to delete {} notes from Anki (and their review history)!".format(
+                                    len(note_ids)))
+        try:
+            with Profiler.phase(self.name, "AnkiConnect delete"):
+                self.ankiconnect.delete_notes(note_ids)
+        except AnkiConnectError as e:
+            self.log.error(e)
+            print("no action taken.")
+            return
+
+        # step 5: write the final ankinote
+        chunks_final = self.render_chunks(state.notes_ankinote_kept)
+        titles_kept = [note.title for note in state.notes_ankinote_kept]
+        self.ankinote.write_chunks_to_ankinote(chunks_final, titles_kept)
+        ChunkHashCache.retain(self.ankinote.ankinote_path, titles_kept)
 
         # boom, delete operation is done
         print("removed {} old notes.".format(count_ankinote_old))
         print("delete operation completed.")
-        
+
+
+
+    def render_chunks(self, notes, deletes=None):
+        '''
+        render a chunk for each note, in order
+
+        rendering is a file read per note (unless the card back is
+        cached), so the notes are rendered by a pool of "io_jobs"
+        threads (from the config, 1 renders them one at a time).
+        executor.map returns the chunks in the same order as the
+        notes, so the result is identical to rendering serially
+        '''
+        if deletes is None:
+            deletes = [None] * len(notes)
+        with Profiler.phase(self.name, "render chunks"):
+            return self.map_notes(Note.chunk_style_first_line, notes, deletes)
+
+
+    def map_notes(self, function, notes, *args):
+        '''
+        call function(note, *args) for each note and return the results
+        in order, using a pool of "io_jobs" threads (from the config)
+        '''
+        io_jobs = Config.get_optional_config_item("io_jobs", 8)
+
+        if io_jobs > 1 and len(notes) > 1:
+            with ThreadPoolExecutor(max_workers=io_jobs) as executor:
+                return list(executor.map(function, notes, *args))
+        return list(map(function, notes, *args))
 
 
     def action_required_prompt(self, message, are_you_sure=False):
@@ -797,8 +1940,13 @@ class AnkiBox:
         pause the script by prompting for user input, to create
         a window of time in which the user can run the required
         external process (the Obsidian_to_Anki plugin)
+
+        (when nobody is there to press <ENTER>, e.g. in watch
+        mode, the message is printed and the script carries on)
         '''
         print("\n[ACTION REQUIRED] {}".format(message))
+        if not self.interactive:
+            return
         if are_you_sure:
             input("\npress <ENTER> to continue...")
             input("press <ENTER> again to confirm you really are ready...")
@@ -811,27 +1959,48 @@ class AnkiBox:
 class App:
     def __init__(self, cli_args):
 
-        logging.basicConfig(
-            level=logging.INFO,
-            # format='[%(asctime)s] [%(levelname)s] [%(name)s.%(funcName)s] %(message)s',
-            format='[%(levelname)s] [%(name)s.%(funcName)s] %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-            )
+        App.configure_logging()
         self.log = logging.getLogger(self.__class__.__name__)
 
         self.log.debug("reading command line arguments...")
         self.cli = cli_args
-        if self.cli.summary:
-            print("")
 
         self.log.debug("loading config file...")
-        Config(self.cli)
+        with Profiler.phase(None, "config"):
+            Config(self.cli)
+
+        if self.cli.rebuild_index:
+            self.log.debug("rebuilding VaultIndex...")
+            with Profiler.phase(None, "vault index"):
+                VaultIndex(rebuild=True)
+        # otherwise the VaultIndex is loaded when a note is first looked up
 
-        self.log.debug("initializing VaultIndex...")
-        VaultIndex()
+        # the caches are only read from disk the first time they're used
+        self.log.debug("enabling caches...")
+        CardBackCache()
+        SummaryCache()
+        IWQueueCache()
+        ChunkHashCache()
+
+
+    @staticmethod
+    def configure_logging():
+        logging.basicConfig(
+            level=logging.INFO,
+            # format='[%(asctime)s] [%(levelname)s] [%(name)s.%(funcName)s] %(message)s',
+            format='[%(levelname)s] [%(name)s.%(funcName)s] %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+            )
 
 
     def run(self):
+        self.run_ankiboxes(self.get_ankiboxes())
+
+
+    def get_ankiboxes(self):
+        '''
+        an AnkiBox for each folder and file in the config
+        '''
 
         # still splitting up folders and files from the config
         source_folders = []
@@ -841,13 +2010,15 @@ class App:
         for config in Config.get_config_item("file"):
             source_files.append(config)
         
+        ankiboxes = []
+
         for folder in source_folders:
             name = folder['name']
             self.log.debug("initializing \"{}\"".format(name))
             action = self.cli
             source = Folder(folder)
-            ankinote = AnkiNote(folder, "folder")
-            ankibox = AnkiBox(name, action, ankinote, source)
+            ankinote = self.get_ankinote(folder, "folder")
+            ankiboxes.append(AnkiBox(name, action, ankinote, source))
 
         for file in source_files:
             name = file['name']
@@ -857,19 +2028,125 @@ class App:
             # 'source' should be set via some logic that figures
             # out which "source of notes" class is appropriate
             # based on file['type']
-            ankinote = AnkiNote(file, "file")
-            ankibox = AnkiBox(name, action, ankinote, source)
+            ankinote = self.get_ankinote(file, "file")
+            ankiboxes.append(AnkiBox(name, action, ankinote, source))
+
+        if Config.get_optional_config_item("sync_backend", "plugin") == "ankiconnect":
+            from ankibox.ankiconnect import AnkiConnect
+
+            ankiconnect = AnkiConnect()
+            for ankibox in ankiboxes:
+                ankibox.ankiconnect = ankiconnect
+
+        return ankiboxes
+
+
+    def get_ankinote(self, config, source_type):
+        '''
+        an AnkiNote, or a ShardedAnkiNote if the config asks for shards
+        (or there are shards left over from a config that did)
+        '''
+        ankinote = AnkiNote(config, source_type)
+        if config.get('shards', 1) > 1 or ShardedAnkiNote.find_shards(ankinote.ankinote_path):
+            return ShardedAnkiNote(config, source_type)
+        return ankinote
+
+
+    def run_ankiboxes(self, ankiboxes):
+        if self.cli.summary:
+            print("")
+
+        if self.cli.jobs > 1:
+            with Profiler.phase(None, "compute states ({} jobs)".format(self.cli.jobs)):
+                self.compute_states(ankiboxes)
+
+        # the ankiboxes are always run (and so print) in config order
+        for ankibox in ankiboxes:
+            ankibox.run()
+
+        with Profiler.phase(None, "card back cache save"):
+            CardBackCache.save()
+        SummaryCache.save()
+        IWQueueCache.save()
+        ChunkHashCache.save()
 
         self.log.debug("done.")
         print("")
         print("")
 
 
+    def export_apkg(self, path):
+        '''
+        export the notes in the source of every ankibox (whether or
+        not they have been added to its ankinote yet) to an Anki
+        package: a deck per ankibox, a card per note
+        '''
+        ankiboxes = self.get_ankiboxes()
+        if self.cli.jobs > 1:
+            self.compute_states(ankiboxes)
+
+        from ankibox.apkg import AnkiPackage
+
+        package = AnkiPackage()
+        for ankibox in ankiboxes:
+            with Profiler.phase(ankibox.name, "export"):
+                notes = tuple(ankibox.get_state().snapshot_source)
+                with Profiler.phase(ankibox.name, "locate notes"):
+                    filepaths = ankibox.map_notes(operator.attrgetter('filepath'), notes)
+                missing = [note.title for note, filepath in zip(notes, filepaths) if filepath is None]
+                for title in missing:
+                    self.log.warning("\"{}\" not found in the vault, not exported".format(title))
+                notes = [note for note, filepath in zip(notes, filepaths) if filepath is not None]
+
+                with Profiler.phase(ankibox.name, "read card backs"):
+                    card_backs = ankibox.map_notes(operator.attrgetter('card_back'), notes)
+                package.add_deck(ankibox.name)
+                for note, card_back in zip(notes, card_backs):
+                    package.add_note(ankibox.name, note.title, card_back, note.filepath)
+            print("{} notes exported from \"{}\"".format(len(notes), ankibox.name))
+
+        with Profiler.phase(None, "write apkg"):
+            package.write(path)
+        CardBackCache.save()
+        print("\nwrote {} notes to {}\n".format(len(package.notes), path))
+
+
+    def compute_states(self, ankiboxes):
+        '''
+        compute the state of every ankibox concurrently
+
+        the work is almost all file system I/O (directory listings,
+        ankinote parsing) so a thread pool is enough, and the threads
+        can share the VaultIndex. each AnkiBox memoizes its state, so
+        running the boxes afterwards reuses what was computed here
+
+        for a short summary, boxes whose counts are still in the
+        SummaryCache are skipped, they don't need a state at all
+        '''
+        if self.cli.summary and not (self.cli.add or self.cli.delete):
+            ankiboxes = [
+                ankibox for ankibox in ankiboxes
+                if SummaryCache.get(ankibox.name, ankibox.get_summary_fingerprint()) is None
+            ]
+        self.log.debug("computing state of {} ankiboxes with {} jobs...".format(
+                       len(ankiboxes), self.cli.jobs))
+        with ThreadPoolExecutor(max_workers=self.cli.jobs) as executor:
+            list(executor.map(AnkiBox.get_state, ankiboxes))
+        self.log.debug("done.")
+
+
 
 
-def main():
+def get_parser():
 
     parser = argparse.ArgumentParser(description="ankibox: turn notes into anki cards")
+    parser.add_argument(
+        'command',
+        nargs='?',
+        choices=['daemon', 'export'],
+        help='"daemon": keep ankibox running in the background to serve summaries quickly, '
+             '"export": export the notes of every ankibox to an Anki package (see --apkg)'
+    )
     parser.add_argument(
         '-a',
         '--add',
@@ -884,6 +2161,19 @@ def main():
         dest='delete',
         help='remove processed notes from ankibox'
     )
+    parser.add_argument(
+        '--resume-delete',
+        action='store_true',
+        dest='resume_delete',
+        help='finish a delete operation that was interrupted (from the delete journal)'
+    )
+    parser.add_argument(
+        '-u',
+        '--update',
+        action='store_true',
+        dest='update',
+        help='refresh the card backs of notes already in the ankinote (keeping their IDs)'
+    )
     parser.add_argument(
         '-s',
         '--summary',
@@ -899,10 +2189,127 @@ def main():
         help='specify config file location (this option is not configured correctly yet)'
         # TESTING.. see the Config class
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        dest='jobs',
+        help='number of ankiboxes to process at the same time'
+    )
+    parser.add_argument(
+        '--rebuild-index',
+        action='store_true',
+        dest='rebuild_index',
+        help='ignore the cached vault index and rebuild it from scratch'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        dest='profile',
+        help='time each phase of the run and print a report at the end'
+    )
+    parser.add_argument(
+        '--profile-cprofile',
+        dest='profile_cprofile',
+        metavar='FILE',
+        help='with --profile, also record the run with cProfile and dump the stats to FILE'
+    )
+    parser.add_argument(
+        '--profile-tracemalloc',
+        dest='profile_tracemalloc',
+        metavar='FILE',
+        help='with --profile, also trace memory allocations and write a report to FILE'
+    )
+    parser.add_argument(
+        '--apkg',
+        dest='apkg',
+        metavar='FILE',
+        help='with "export", the .apkg file to write'
+    )
+    parser.add_argument(
+        '-w',
+        '--watch',
+        action='store_true',
+        dest='watch',
+        help='keep running and print new/old counts whenever an ankibox changes'
+    )
+    parser.add_argument(
+        '--watch-add',
+        action='store_true',
+        dest='watch_add',
+        help='with --watch, add new notes to the ankinote as soon as they appear'
+    )
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=2.0,
+        dest='watch_interval',
+        metavar='SECONDS',
+        help='with --watch, how often to poll for changes when inotify is not available'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=1.0,
+        dest='debounce',
+        metavar='SECONDS',
+        help='with --watch, wait for changes to stop for this long before updating'
+    )
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        dest='no_daemon',
+        help='run in this process even if an ankibox daemon is running'
+    )
+    return parser
+
+
+def main(argv=None, use_daemon=True):
+    '''
+    argv defaults to the command line. use_daemon is False when the
+    thin client (client.py) has already offered this run to a daemon
+    '''
+    parser = get_parser()
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+
+    if args.command == "daemon":
+        from ankibox.daemon import AnkiBoxDaemon
+
+        App.configure_logging()
+        AnkiBoxDaemon(parser, args).serve_forever()
+        return
+
+    if args.command == "export" and not args.apkg:
+        parser.error('"export" needs an --apkg FILE to write to')
+
+    if args.watch:
+        from ankibox.watch import Watcher
+
+        app = App(args)
+        Watcher(app.get_ankiboxes(), args).run()
+        return
+
+    if use_daemon:
+        from ankibox.client import run_in_daemon
+        from ankibox.daemon import can_run_in_daemon
+        from ankibox.daemon import get_socket_path
+
+        if can_run_in_daemon(args) and run_in_daemon(argv, get_socket_path()):
+            return
+
+    if args.profile:
+        Profiler(cprofile_path=args.profile_cprofile, tracemalloc_path=args.profile_tracemalloc)
 
     app = App(args)
-    app.run()
+    if args.command == "export":
+        app.export_apkg(args.apkg)
+    else:
+        app.run()
+
+    Profiler.report()
 
 
 
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# AnkiConnect sync backend
+#
+# osgav 2023
+#
+
+
+import html
+import http.client
+import json
+import logging
+import time
+import urllib.parse
+
+from ankibox.app_config import Config
+
+
+ANKICONNECT_VERSION = 6
+
+
+
+
+class AnkiConnectError(Exception):
+    '''
+    AnkiConnect couldn't be reached, or answered with an error
+    '''
+
+
+
+
+class AnkiConnectActionError(AnkiConnectError):
+    '''
+    AnkiConnect was reached, but answered with an error
+    '''
+
+
+
+
+class AnkiConnect:
+    '''
+    a client for the AnkiConnect add-on, so ankibox can add and
+    delete cards in Anki itself instead of handing the ankinote to
+    the Obsidian_to_Anki plugin and waiting for someone to run it
+
+    it is enabled with sync_backend = "ankiconnect" in the config,
+    and configured with (all optional):
+
+    - ankiconnect_url: default "http://127.0.0.1:8765"
+    - ankiconnect_batch_size: notes per request, default 100
+    - ankiconnect_retries: retries per request, default 3
+    - ankiconnect_timeout: seconds, default 30
+    - ankiconnect_model: note type, default "Basic" (with fields
+      ankiconnect_front_field / ankiconnect_back_field, default
+      "Front" / "Back")
+    - ankiconnect_tags: default ["Obsidian_to_Anki"], the tag the
+      plugin would have given the cards
+
+    one HTTP connection is opened and kept alive for every request
+    of a run. if a request fails to get through, the connection is
+    reopened and the request retried (with a growing delay). that
+    is safe even for addNotes: Anki rejects a duplicate note, and
+    rejected notes are looked up with findNotes afterwards
+    '''
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.url = Config.get_optional_config_item("ankiconnect_url", "http://127.0.0.1:8765")
+        url = urllib.parse.urlsplit(self.url)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.path = url.path or "/"
+
+        self.batch_size = Config.get_optional_config_item("ankiconnect_batch_size", 100)
+        self.retries = Config.get_optional_config_item("ankiconnect_retries", 3)
+        self.timeout = Config.get_optional_config_item("ankiconnect_timeout", 30)
+        self.model = Config.get_optional_config_item("ankiconnect_model", "Basic")
+        self.front_field = Config.get_optional_config_item("ankiconnect_front_field", "Front")
+        self.back_field = Config.get_optional_config_item("ankiconnect_back_field", "Back")
+        self.tags = Config.get_optional_config_item("ankiconnect_tags", ["Obsidian_to_Anki"])
+
+        self.connection = None
+        self.requests_sent = 0
+        self.log.debug("AnkiConnect backend at {}".format(self.url))
+
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+    def request(self, action, **params):
+        '''
+        send one action to AnkiConnect and return its result
+        '''
+        body = json.dumps({'action': action, 'version': ANKICONNECT_VERSION, 'params': params}).encode()
+        headers = {'Content-Type': "application/json"}
+
+        for attempt in range(self.retries + 1):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self.connection.request("POST", self.path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                self.requests_sent += 1
+                if response.status != 200:
+                    raise http.client.HTTPException("HTTP {} {}".format(response.status, response.reason))
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                if attempt == self.retries:
+                    raise AnkiConnectError("{} failed: could not reach AnkiConnect at {} ({})".format(
+                                           action, self.url, e))
+                delay = 0.5 * 2 ** attempt
+                self.log.debug("{} failed ({}), retrying in {}s...".format(action, e, delay))
+                time.sleep(delay)
+
+        try:
+            reply = json.loads(data)
+        except ValueError:
+            raise AnkiConnectError("{} failed: AnkiConnect's reply isn't JSON".format(action))
+        if reply.get('error') is not None:
+            raise AnkiConnectActionError("{} failed: {}".format(action, reply['error']))
+        return reply['result']
+
+
+    def batches(self, items):
+        for start in range(0, len(items), self.batch_size):
+            yield items[start:start + self.batch_size]
+
+
+    def make_note(self, deck, front, back):
+        return {
+            'deckName': deck,
+            'modelName': self.model,
+            'fields': {
+                self.front_field: html.escape(front),
+                self.back_field: html.escape(back),
+            },
+            'tags': self.tags,
+            'options': {'allowDuplicate': False, 'duplicateScope': "deck"},
+        }
+
+
+    def quote(self, text):
+        '''
+        quote text for an Anki search, so it only matches literally
+        '''
+        for special in ('\\', '"', '*', '_'):
+            text = text.replace(special, "\\" + special)
+        return '"{}"'.format(text)
+
+
+    def add_notes(self, deck, cards):
+        '''
+        add a note to the deck for each (front, back) card, creating
+        the deck if need be, and return their note IDs in the same
+        order (None for a card that couldn't be added)
+
+        cards Anki rejects as duplicates (e.g. added by an earlier run
+        that died before writing the IDs back) are looked up by their
+        front, and get the ID of the note already in the deck
+
+        older versions of AnkiConnect return null for each rejected
+        note. newer ones add every note they can, then answer the whole
+        batch with a single error, so then every note of the batch is
+        looked up (which also finds the IDs of the ones that went in)
+        '''
+        self.request("createDeck", deck=deck)
+
+        ids = []
+        for batch in self.batches(cards):
+            notes = [self.make_note(deck, front, back) for front, back in batch]
+            try:
+                ids.extend(self.request("addNotes", notes=notes))
+            except AnkiConnectActionError as e:
+                self.log.debug("{}, looking the batch up...".format(e))
+                ids.extend([None] * len(batch))
+
+        rejected = [i for i, note_id in enumerate(ids) if note_id is None]
+        if rejected:
+            self.log.debug("{} notes rejected, looking them up...".format(len(rejected)))
+            queries = [
+                "deck:{} {}".format(self.quote(deck), self.quote("{}:{}".format(
+                                    self.front_field, html.escape(cards[i][0]))))
+                for i in rejected
+            ]
+            for i, found in zip(rejected, self.find_notes(queries)):
+                if len(found) == 1:
+                    ids[i] = found[0]
+        return ids
+
+
+    def find_notes(self, queries):
+        '''
+        run each query (batched into "multi" requests) and return
+        the list of note IDs found for each one, in order
+        '''
+        results = []
+        for batch in self.batches(queries):
+            actions = [{'action': "findNotes", 'params': {'query': query}} for query in batch]
+            for result in self.request("multi", actions=actions):
+                # from version 6 on, each result is wrapped like a reply
+                if isinstance(result, dict):
+                    if result.get('error') is not None:
+                        raise AnkiConnectError("findNotes failed: {}".format(result['error']))
+                    result = result.get('result')
+                results.append(result or [])
+        return results
+
+
+    def update_notes(self, cards):
+        '''
+        set the fields of each (note ID, front, back) card, batched
+        into "multi" requests
+        '''
+        for batch in self.batches(cards):
+            actions = [
+                {'action': "updateNoteFields", 'params': {'note': {
+                    'id': note_id,
+                    'fields': {self.front_field: html.escape(front), self.back_field: html.escape(back)},
+                }}}
+                for note_id, front, back in batch
+            ]
+            for result in self.request("multi", actions=actions):
+                if isinstance(result, dict) and result.get('error') is not None:
+                    raise AnkiConnectError("updateNoteFields failed: {}".format(result['error']))
+
+
+    def delete_notes(self, note_ids):
+        for batch in self.batches(note_ids):
+            self.request("deleteNotes", notes=batch)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# ankinote parser
+#
+# osgav 2023
+#
+
+
+import logging
+import os
+from typing import NamedTuple
+
+
+ANKINOTE_DIVIDER = "---\n"
+
+log = logging.getLogger("AnkiNoteParser")
+
+
+
+
+class AnkiNoteEntry(NamedTuple):
+    '''
+    one entry of an ankinote, i.e. one rendered chunk
+    '''
+    filepath: str
+    card_front: str
+    card_back: str
+    obsidian_to_anki_id: str    # None until the Obsidian_to_Anki plugin has run
+    line_number: int            # line the entry starts on (1-based)
+
+
+
+
+def parse_ankinote(lines, anki_card_tag, name=None):
+    '''
+    parse an ankinote in a single pass, yielding an AnkiNoteEntry
+    for each entry as soon as its closing divider is read
+
+    "lines" is any iterable of lines (e.g. an open file), so the
+    whole ankinote never has to be held in memory
+
+    an ankinote looks like:
+
+        <header: TARGET DECK>
+        ---
+        <entry>
+        ---
+        <entry>
+        ---
+
+    the section before the first divider is the header and is
+    skipped. anything after the last divider is ignored. entries
+    without a card front are malformed: they are reported with
+    their line number and skipped
+    '''
+    name = name or "ankinote"
+    block_index = 0
+    block_start = 1
+    line_number = 0
+
+    filepath = None
+    card_front = None
+    card_back = None
+    anki_id = None
+    expecting_back = False
+    has_text = False
+
+    for line_number, line in enumerate(lines, start=1):
+
+        if line == ANKINOTE_DIVIDER:
+            if block_index > 0:
+                if card_front is None:
+                    log.warning("malformed entry in \"{}\" at line {}: no card front found, skipping it".format(
+                                name, block_start))
+                else:
+                    if filepath is None:
+                        log.warning("malformed entry in \"{}\" at line {}: no filepath found".format(
+                                    name, block_start))
+                    yield AnkiNoteEntry(filepath, card_front, card_back or "", anki_id, block_start)
+            block_index += 1
+            block_start = line_number + 1
+            filepath = card_front = card_back = anki_id = None
+            expecting_back = has_text = False
+            continue
+
+        if block_index == 0:
+            # still in the header
+            continue
+
+        line = line[:-1] if line.endswith("\n") else line
+        has_text = has_text or bool(line.strip())
+
+        if expecting_back:
+            card_back = line
+            expecting_back = False
+        elif card_front is None and line.endswith(anki_card_tag):
+            card_front = line.removesuffix(anki_card_tag).strip()
+            expecting_back = True
+        elif filepath is None and line.startswith("filepath:"):
+            filepath = line.partition(":")[2].strip()
+        elif anki_id is None and line.startswith("<!--ID:"):
+            anki_id = line.strip()
+
+    if block_index > 0 and has_text:
+        log.warning("text after the last divider in \"{}\" (from line {} to {}) was ignored".format(
+                    name, block_start, line_number))
+
+
+def ends_with_divider(path):
+    '''
+    does the ankinote at path end with a divider (i.e. is there nothing
+    trailing its last entry, so chunks can be appended to it)?
+
+    None if there is no file at path, False if it can't be read
+    '''
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - len(ANKINOTE_DIVIDER) - 1))
+            return f.read() == ("\n" + ANKINOTE_DIVIDER).encode()
+    except FileNotFoundError:
+        return None
+    except OSError:
+        return False
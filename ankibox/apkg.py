@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# Anki package (.apkg) export
+#
+# osgav 2023
+#
+
+
+import hashlib
+import html
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+
+# the collection schema (version 11) that Anki imports .apkg files from
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+DECK_OPTIONS = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "timer": 0,
+    "autoplay": True, "replayq": True, "dyn": False,
+    "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500,
+            "separate": True, "order": 1, "perDay": 20, "bury": False},
+    "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "minSpace": 1,
+            "ivlFct": 1, "maxIvl": 36500, "bury": False},
+    "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0},
+}
+
+GUID_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    "!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+)
+
+
+
+
+def stable_id(*parts):
+    '''
+    a 64 bit number that only depends on the parts it's made from
+    '''
+    digest = hashlib.sha256("\x1f".join(parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def get_guid(key):
+    '''
+    a note GUID in the same base91 form Anki uses. Anki matches an
+    imported note to an existing one by GUID, so deriving it from
+    the note's filepath makes exporting the same notes again update
+    them rather than duplicate them
+    '''
+    number = stable_id("guid", key)
+    guid = ""
+    while number:
+        number, digit = divmod(number, len(GUID_ALPHABET))
+        guid = GUID_ALPHABET[digit] + guid
+    return guid or GUID_ALPHABET[0]
+
+
+def get_field_checksum(text):
+    return int(hashlib.sha1(text.encode()).hexdigest()[:8], 16)
+
+
+
+
+class AnkiPackage:
+    '''
+    an Anki package (.apkg) built from scratch with sqlite3 and zipfile
+
+    an .apkg is a zip file holding a collection (a sqlite database,
+    "collection.anki2") and a "media" map. the package gets a "Basic"
+    style note type (fields Front / Back) and one deck per ankibox,
+    each card is a note's title on the front and its first line on
+    the back
+
+    notes are collected in memory first, then written to the database
+    in one transaction with executemany, which is what keeps an export
+    of tens of thousands of cards to a few seconds
+    '''
+    def __init__(self, model_name="ankibox", tags=("ankibox",)):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.now = int(time.time())
+        self.model_id = stable_id("model", model_name) >> 21     # fits in a JSON-safe integer
+        self.model_name = model_name
+        self.tags = " {} ".format(" ".join(tags)) if tags else ""
+        self.decks = {}         # name -> deck id
+        self.notes = []         # note rows
+        self.cards = []         # card rows
+
+
+    def add_deck(self, name):
+        if name not in self.decks:
+            self.decks[name] = stable_id("deck", name) >> 21
+        return self.decks[name]
+
+
+    def add_note(self, deck, front, back, key):
+        '''
+        add a note (and its one card) to a deck. "key" identifies the
+        note across exports (the note's filepath) and sets its GUID
+        '''
+        deck_id = self.add_deck(deck)
+        position = len(self.notes) + 1
+        note_id = self.now * 1000 + position
+        front = html.escape(front)
+        self.notes.append((
+            note_id, get_guid(key), self.model_id, self.now, -1, self.tags,
+            "{}\x1f{}".format(front, html.escape(back)), front,
+            get_field_checksum(front), 0, "",
+        ))
+        self.cards.append((
+            note_id, note_id, deck_id, 0, self.now, -1,
+            0, 0, position, 0, 0, 0, 0, 0, 0, 0, 0, "",
+        ))
+
+
+    def get_model(self):
+        fields = [
+            {"name": name, "ord": ord, "sticky": False, "rtl": False,
+             "font": "Arial", "size": 20, "media": []}
+            for ord, name in enumerate(("Front", "Back"))
+        ]
+        template = {
+            "name": "Card 1", "ord": 0, "did": None, "bqfmt": "", "bafmt": "",
+            "qfmt": "{{Front}}", "afmt": "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}",
+        }
+        return {
+            "id": self.model_id, "name": self.model_name, "type": 0, "mod": self.now,
+            "usn": -1, "sortf": 0, "did": 1, "tmpls": [template], "flds": fields,
+            "css": ".card { font-family: arial; font-size: 20px; text-align: center; }",
+            "latexPre": "", "latexPost": "", "tags": [], "vers": [], "req": [[0, "any", [0]]],
+        }
+
+
+    def get_decks(self):
+        decks = {"Default": 1}
+        decks.update(self.decks)
+        return {
+            str(deck_id): {
+                "id": deck_id, "name": name, "desc": "", "mod": self.now, "usn": -1,
+                "collapsed": False, "browserCollapsed": False, "dyn": 0, "conf": 1,
+                "extendNew": 0, "extendRev": 0, "newToday": [0, 0], "revToday": [0, 0],
+                "lrnToday": [0, 0], "timeToday": [0, 0],
+            }
+            for name, deck_id in decks.items()
+        }
+
+
+    def get_col(self):
+        conf = {
+            "nextPos": len(self.notes) + 1, "estTimes": True, "activeDecks": [1],
+            "sortType": "noteFld", "timeLim": 0, "sortBackwards": False,
+            "addToCur": True, "curDeck": 1, "newSpread": 0, "dueCounts": True,
+            "curModel": self.model_id, "collapseTime": 1200,
+        }
+        return (
+            1, self.now, self.now * 1000, self.now * 1000, 11, 0, 0, 0,
+            json.dumps(conf),
+            json.dumps({str(self.model_id): self.get_model()}),
+            json.dumps(self.get_decks()),
+            json.dumps({"1": DECK_OPTIONS}),
+            "{}",
+        )
+
+
+    def write(self, path):
+        '''
+        write the package to path (via a temp file and a rename, so
+        a failed export never leaves half a package behind)
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            collection_path = os.path.join(tmp, "collection.anki2")
+            db = sqlite3.connect(collection_path)
+            try:
+                db.executescript(SCHEMA)
+                with db:
+                    db.execute("INSERT INTO col VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", self.get_col())
+                    db.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", self.notes)
+                    db.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", self.cards)
+            finally:
+                db.close()
+
+            tmp_path = "{}.tmp".format(path)
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as package:
+                package.write(collection_path, "collection.anki2")
+                package.writestr("media", "{}")
+            os.replace(tmp_path, path)
+
+        self.log.debug("wrote {} notes in {} decks to {}".format(len(self.notes), len(self.decks), path))
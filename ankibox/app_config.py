@@ -12,6 +12,9 @@ import logging
 import os
 import tomli
 
+from ankibox.locations import CONFIG_PATH
+from ankibox.scan import stat_path
+
 
 
 
@@ -30,13 +33,15 @@ class ConfigValidator:
     def validate_config(self):
         self.check_folder_paths()
         self.check_file_paths()
+        self.check_shards()
 
     def check_folder_paths(self):
         # TODO: INSERT ERROR HANDLING HERE
         self.log.debug("checking folders...")
         for folder in self.config['folder']:
             # self.log.debug(folder)
-            if os.path.isdir(folder['path']):
+            info = stat_path(folder['path'])
+            if info and info.is_dir:
                 pass
             else:
                 self.log.debug("path for \"{}\" is not a folder!".format(folder['name']))
@@ -46,12 +51,21 @@ class ConfigValidator:
         # TODO: INSERT ERROR HANDLING HERE
         self.log.debug("checking files...")
         for file in self.config['file']:
-            if os.path.isfile(file['path']):
+            info = stat_path(file['path'])
+            if info and info.is_file:
                 pass
             else:
                 self.log.debug("path for \"{}\" is not a file!".format(file['name']))
                 exit()
 
+    def check_shards(self):
+        self.log.debug("checking shards...")
+        for box in self.config['folder'] + self.config['file']:
+            shards = box.get('shards', 1)
+            if type(shards) is not int or shards < 1:
+                self.log.error("shards for \"{}\" must be a whole number, 1 or more!".format(box['name']))
+                exit()
+
 
 
 
@@ -77,6 +91,7 @@ class Config:
     '''
 
     _config = None
+    _config_path = None
 
     def __init__(self, cli_args):
         self.log = logging.getLogger(self.__class__.__name__)
@@ -102,14 +117,13 @@ class Config:
         # it's generally going to use the one in the default location.
         # i don't think i'll even bother adding the env var option...
         # i might not even finish adding the cli arg capability properly?
-        # right now, load_config_file() uses a hardcoded location
+        # right now, load_config_file() uses a hardcoded location (CONFIG_PATH)
         # and that's good enough.
         #
 
     def load_config_file(self):
-        CONFIG = "/home/doj/.ankibox/config.toml" # HARDCODED VALUE ...
-        # CONFIG = "./ankiboxtestvault-config.toml" # HARDCODED VALUE ...
-        with open(CONFIG, "rb") as f:
+        Config._config_path = CONFIG_PATH
+        with open(CONFIG_PATH, "rb") as f:
             Config._config = tomli.load(f)
 
     def validate_config_file(self):
@@ -127,3 +141,15 @@ class Config:
     @staticmethod
     def get_config_item(item):
         return Config._config[item]
+
+    @staticmethod
+    def get_optional_config_item(item, default):
+        return Config._config.get(item, default)
+
+    @staticmethod
+    def get_config_dir():
+        '''
+        the directory holding the config file, which is also
+        where ankibox keeps its cache files
+        '''
+        return os.path.dirname(Config._config_path or CONFIG_PATH)
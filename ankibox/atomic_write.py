@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# atomic file writes
+#
+# osgav 2023
+#
+
+
+import os
+
+
+
+
+def write_atomically(path, strings):
+    '''
+    write strings to a file so that the file is either completely
+    the old version or completely the new one, never half-written:
+
+    - write everything to a temp file in the same directory
+    - fsync it
+    - rename it over the original (os.replace is atomic)
+    '''
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "w") as f:
+        for string in strings:
+            f.write(string)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_durably(path, strings):
+    '''
+    append strings to the end of a file, and fsync it before returning
+    '''
+    with open(path, "a") as f:
+        for string in strings:
+            f.write(string)
+        f.flush()
+        os.fsync(f.fileno())
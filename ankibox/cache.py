@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# caches
+#
+# osgav 2023
+#
+
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from ankibox.app_config import Config
+from ankibox.atomic_write import write_atomically
+from ankibox.fingerprint import is_racy
+from ankibox.profiling import Profiler
+
+
+
+
+class JSONCache:
+    '''
+    a persistent cache, kept as JSON in a file in the config dir
+
+    each subclass gets its own cache, lock and "dirty" flag (in class
+    variables), and sets the file it is kept in (and a description,
+    for the log)
+
+    instantiating a cache doesn't read its file, that only happens the
+    first time an entry is asked for, so a run that never needs a cache
+    (e.g. a summary served from the SummaryCache never needs the card
+    backs) never reads it. saving only writes the file if anything
+    changed, and writes it atomically
+    '''
+
+    filename = None
+    description = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._cache = None
+        cls._cache_path = None
+        cls._dirty = False
+        cls._lock = threading.Lock()
+
+
+    def __init__(self):
+        cls = self.__class__
+        cls._cache_path = os.path.join(Config.get_config_dir(), cls.filename)
+        cls._cache = None
+        cls._dirty = False
+
+
+    @classmethod
+    def get_cache(cls):
+        '''
+        the cache's entries, read from its file the first time they
+        are needed (or None, if the cache isn't in use)
+        '''
+        if cls._cache is None and cls._cache_path is not None:
+            with cls._lock:
+                if cls._cache is None:
+                    with Profiler.phase(None, "{} load".format(cls.description)):
+                        cls._cache = cls.from_json(cls.read())
+        return cls._cache
+
+
+    @classmethod
+    def read(cls):
+        log = logging.getLogger(cls.__name__)
+        try:
+            with open(cls._cache_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            log.debug("no usable {} found".format(cls.description))
+            return None
+        log.debug("{} loaded ({} entries).".format(cls.description, len(data)))
+        return data
+
+
+    @classmethod
+    def from_json(cls, data):
+        '''
+        the in-memory cache, from what was read from the file
+        '''
+        return data if isinstance(data, dict) else {}
+
+
+    @classmethod
+    def to_json(cls):
+        '''
+        what gets written to the file, from the in-memory cache
+        '''
+        return cls._cache
+
+
+    @classmethod
+    def save(cls):
+        if cls._cache is None or not cls._dirty:
+            return
+        try:
+            write_atomically(cls._cache_path, [json.dumps(cls.to_json())])
+            cls._dirty = False
+        except OSError as e:
+            logging.getLogger(cls.__name__).warning("could not write {}: {}".format(cls.description, e))
+
+
+
+
+class CardBackCache(JSONCache):
+    '''
+    a persistent cache of card backs (the first meaningful line of a note)
+
+    entries are keyed by filepath and only used while the file's
+    (mtime_ns, size) fingerprint still matches, so an unchanged note
+    never has to be opened again to render its chunk. a note changed
+    only just now isn't cached (yet), see is_racy
+
+    the cache is an LRU: entries are kept in least- to most-recently
+    used order and the oldest are evicted once "card_back_cache_size"
+    (from the config) is exceeded. on disk it is a list of entries,
+    oldest first, so the LRU order survives the round trip
+
+    notes may be rendered from several threads, so access is locked
+    '''
+
+    filename = "card_back_cache.json"
+    description = "card back cache"
+    _max_entries = None
+
+    def __init__(self):
+        super().__init__()
+        CardBackCache._max_entries = Config.get_optional_config_item("card_back_cache_size", 10000)
+
+
+    @classmethod
+    def from_json(cls, data):
+        cache = OrderedDict()
+        if isinstance(data, list):
+            for filepath, mtime_ns, size, card_back in data[-cls._max_entries:]:
+                cache[filepath] = (mtime_ns, size, card_back)
+        return cache
+
+
+    @classmethod
+    def to_json(cls):
+        return [
+            [filepath, mtime_ns, size, card_back]
+            for filepath, (mtime_ns, size, card_back) in cls._cache.items()
+        ]
+
+
+    @staticmethod
+    def get(filepath, fingerprint):
+        '''
+        return the cached card back for a file, or None if there
+        isn't one for this version of the file
+        '''
+        if fingerprint is None:
+            return None
+        cache = CardBackCache.get_cache()
+        if cache is None:
+            return None
+        with CardBackCache._lock:
+            entry = cache.get(filepath)
+            if entry is None or entry[:2] != fingerprint:
+                return None
+            cache.move_to_end(filepath)
+            return entry[2]
+
+
+    @staticmethod
+    def put(filepath, fingerprint, card_back):
+        if fingerprint is None or is_racy(fingerprint):
+            return
+        cache = CardBackCache.get_cache()
+        if cache is None:
+            return
+        with CardBackCache._lock:
+            cache[filepath] = (fingerprint[0], fingerprint[1], card_back)
+            cache.move_to_end(filepath)
+            while len(cache) > CardBackCache._max_entries:
+                cache.popitem(last=False)
+            CardBackCache._dirty = True
+
+
+
+
+class SummaryCache(JSONCache):
+    '''
+    a persistent cache of each ankibox's new / old counts
+
+    an ankibox's counts can only change if its source (the folder's
+    listing, or the IW queue file) or its ankinote changed, so the
+    counts are stored with the fingerprints of both, and while those
+    still match, "ankibox -s" can print them without listing the
+    folder or parsing the ankinote
+
+    a folder's fingerprint is its directory's mtime, which changes
+    whenever a note is created, deleted or renamed in it (editing a
+    note doesn't change its title, so doesn't matter here)
+    '''
+
+    filename = "summary_cache.json"
+    description = "summary cache"
+
+
+    @staticmethod
+    def get(name, fingerprint):
+        '''
+        return the cached (new, old) counts of an ankibox, or None
+        if its source or ankinote changed since they were cached
+        '''
+        cache = SummaryCache.get_cache()
+        if cache is None:
+            return None
+        with SummaryCache._lock:
+            entry = cache.get(name)
+        if entry is None or entry['fingerprint'] != json.dumps(fingerprint):
+            return None
+        return tuple(entry['counts'])
+
+
+    @staticmethod
+    def put(name, fingerprint, counts):
+        cache = SummaryCache.get_cache()
+        if cache is None:
+            return
+        entry = {'fingerprint': json.dumps(fingerprint), 'counts': list(counts)}
+        with SummaryCache._lock:
+            if cache.get(name) != entry:
+                cache[name] = entry
+                SummaryCache._dirty = True
+
+
+
+
+class IWQueueCache(JSONCache):
+    '''
+    a persistent cache of the rows already parsed out of each IW queue
+
+    for each queue it keeps the note titles parsed so far, the byte
+    offset parsing got up to, and a checksum of the bytes before that
+    offset. IW queues mostly grow at the end, so as long as the start
+    of the file still matches the checksum, only the rows after the
+    offset have to be parsed. anything else (a reordered or rewritten
+    queue) means a full parse
+    '''
+
+    filename = "iw_queue_cache.json"
+    description = "IW queue cache"
+
+
+    @staticmethod
+    def get(path):
+        '''
+        return the cached {offset, checksum, titles} of a queue, or None
+        '''
+        cache = IWQueueCache.get_cache()
+        if cache is None:
+            return None
+        with IWQueueCache._lock:
+            return cache.get(path)
+
+
+    @staticmethod
+    def put(path, offset, checksum, titles):
+        cache = IWQueueCache.get_cache()
+        if cache is None:
+            return
+        with IWQueueCache._lock:
+            entry = cache.get(path)
+            if entry and entry['offset'] == offset and entry['checksum'] == checksum:
+                return
+            cache[path] = {'offset': offset, 'checksum': checksum, 'titles': titles}
+            IWQueueCache._dirty = True
+
+
+
+
+class ChunkHashCache(JSONCache):
+    '''
+    a persistent record of the chunk last rendered for each ankinote
+    entry (for --update): a hash of the chunk, and the fingerprint
+    its note's file had when it was rendered
+
+    an entry whose note still has the same fingerprint, and whose
+    chunk in the ankinote still hashes the same, can't be stale, so
+    its note doesn't have to be read again. (a note changed only
+    just now isn't recorded, see is_racy.) the records of entries
+    that are gone from the ankinote are dropped by retain()
+    '''
+
+    filename = "chunk_hash_cache.json"
+    description = "chunk hash cache"
+
+
+    @staticmethod
+    def get(ankinote_path, title):
+        '''
+        return (fingerprint, chunk hash) for an entry, or None
+        '''
+        cache = ChunkHashCache.get_cache()
+        if cache is None:
+            return None
+        with ChunkHashCache._lock:
+            entry = cache.get(ankinote_path, {}).get(title)
+        if entry is None:
+            return None
+        return ((entry[0], entry[1]), entry[2])
+
+
+    @staticmethod
+    def put(ankinote_path, title, fingerprint, chunk_hash):
+        if fingerprint is None or is_racy(fingerprint):
+            return
+        cache = ChunkHashCache.get_cache()
+        if cache is None:
+            return
+        entry = [fingerprint[0], fingerprint[1], chunk_hash]
+        with ChunkHashCache._lock:
+            entries = cache.setdefault(ankinote_path, {})
+            if entries.get(title) != entry:
+                entries[title] = entry
+                ChunkHashCache._dirty = True
+
+
+    @staticmethod
+    def retain(ankinote_path, titles):
+        '''
+        forget the records of every entry of an ankinote that isn't
+        one of titles (i.e. the entries it was just written with)
+        '''
+        cache = ChunkHashCache.get_cache()
+        if cache is None:
+            return
+        titles = set(titles)
+        with ChunkHashCache._lock:
+            entries = cache.get(ankinote_path, {})
+            gone = [title for title in entries if title not in titles]
+            for title in gone:
+                del entries[title]
+            if gone:
+                ChunkHashCache._dirty = True
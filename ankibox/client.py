@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# the ankibox command (and the daemon's client)
+#
+# osgav 2023
+#
+
+
+import json
+import os
+import socket
+import sys
+
+from ankibox.locations import CONFIG_PATH
+from ankibox.locations import SOCKET_NAME
+
+
+CLIENT_TIMEOUT = 5   # seconds
+
+
+
+
+def run_in_daemon(argv, socket_path):
+    '''
+    send the command line to a running daemon and print its output
+
+    returns False if there is no daemon to talk to (or it could not
+    handle the request), so the caller can run in-process instead
+    '''
+    request = json.dumps({'argv': argv}).encode() + b"\n"
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(socket_path)
+            client.sendall(request)
+            client.shutdown(socket.SHUT_WR)
+            with client.makefile("rb") as f:
+                response = json.loads(f.read())
+    except (OSError, ValueError):
+        return False
+
+    if response.get('status') != "ok":
+        return False
+    print(response['output'], end="")
+    return True
+
+
+def main():
+    '''
+    the "ankibox" command
+
+    the command line is offered to a running daemon before anything
+    else is imported (the daemon parses it, and turns down anything it
+    can't serve), so a run the daemon serves costs little more than
+    starting the interpreter. anything else runs in this process
+    '''
+    argv = sys.argv[1:]
+    socket_path = os.path.join(os.path.dirname(CONFIG_PATH), SOCKET_NAME)
+    if "--no-daemon" not in argv and run_in_daemon(argv, socket_path):
+        return
+
+    from ankibox.ankibox import main as main_in_process
+    main_in_process(argv, use_daemon=False)
+
+
+
+
+if __name__ == '__main__':
+    main()
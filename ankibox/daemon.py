@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# daemon mode (ankibox daemon)
+#
+# osgav 2023
+#
+
+
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socketserver
+
+from ankibox.app_config import Config
+from ankibox.client import run_in_daemon
+from ankibox.fingerprint import get_fingerprint
+from ankibox.locations import SOCKET_NAME
+
+
+
+
+def get_socket_path():
+    '''
+    the daemon's socket lives next to the config file
+    '''
+    return os.path.join(Config.get_config_dir(), SOCKET_NAME)
+
+
+def can_run_in_daemon(args):
+    '''
+    only read-only runs are handed to the daemon: add and delete
+    prompt for input, and the other options change how this one
+    process runs
+    '''
+    return not (
+        args.command
+        or args.add
+        or args.delete
+        or args.update
+        or args.resume_delete
+        or args.rebuild_index
+        or args.profile
+        or args.watch
+        or args.no_daemon
+    )
+
+
+
+
+class AnkiBoxDaemon:
+    '''
+    a long-lived ankibox process, serving runs over a Unix socket
+
+    it keeps the config, the ankiboxes (each with its memoized state,
+    i.e. its parsed snapshots) and the VaultIndex in memory between
+    requests. for each request:
+
+    - the config is reloaded only if the config file changed
+    - each ankibox recomputes its state only if its source or
+      ankinote fingerprint changed (or if the fingerprint was racy
+      when the state was computed, see is_racy)
+    - the VaultIndex is kept, but expired, so the next lookup (if
+      there is one) first refreshes it in memory, listing only the
+      directories whose mtime changed
+
+    the "ankibox" command (see client.py) offers each run to the
+    daemon before importing any of this
+    '''
+    def __init__(self, parser, args):
+        from ankibox.ankibox import App
+
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.parser = parser
+        self.app = App(args)
+        self.config_fingerprint = get_fingerprint(Config._config_path)
+        self.ankiboxes = self.app.get_ankiboxes()
+        self.socket_path = get_socket_path()
+
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            if run_in_daemon(["--summary"], self.socket_path):
+                self.log.warning("a daemon is already listening on {}".format(self.socket_path))
+                return
+            os.remove(self.socket_path)
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                response = daemon.handle_request(self.rfile.readline())
+                self.wfile.write(json.dumps(response).encode())
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, stop)
+
+        with socketserver.UnixStreamServer(self.socket_path, Handler) as server:
+            os.chmod(self.socket_path, 0o600)
+            print("ankibox daemon listening on {}".format(self.socket_path))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(self.socket_path)
+
+
+    def handle_request(self, line):
+        try:
+            argv = json.loads(line)['argv']
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                args = self.parser.parse_args(argv)
+        except (ValueError, KeyError, SystemExit):
+            return {'status': "error"}
+
+        if not can_run_in_daemon(args):
+            return {'status': "unsupported"}
+
+        self.refresh()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.app.cli = args
+            for ankibox in self.ankiboxes:
+                ankibox.action = args
+            self.app.run_ankiboxes(self.ankiboxes)
+
+        return {'status': "ok", 'output': output.getvalue()}
+
+
+    def refresh(self):
+        from ankibox.ankibox import VaultIndex
+
+        config_fingerprint = get_fingerprint(Config._config_path)
+        if config_fingerprint != self.config_fingerprint:
+            self.log.info("config file changed, reloading it")
+            Config(self.app.cli)
+            self.config_fingerprint = config_fingerprint
+            self.ankiboxes = self.app.get_ankiboxes()
+            VaultIndex.unload()
+        VaultIndex.expire()
+        for ankibox in self.ankiboxes:
+            ankibox.expire_state()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# file fingerprints
+#
+# osgav 2023
+#
+
+
+import os
+import time
+
+from ankibox.app_config import Config
+
+
+
+
+def get_fingerprint(path):
+    '''
+    a cheap fingerprint of a file or directory: (mtime_ns, size)
+
+    for a directory the mtime changes whenever an entry is added,
+    removed or renamed, which is all a snapshot of it depends on
+
+    returns None if there is nothing at the path
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_mtimes(fingerprint):
+    '''
+    the mtimes in a fingerprint, or in a (nested) tuple of them
+    '''
+    if fingerprint is None:
+        return []
+    if isinstance(fingerprint[0], int):
+        return [fingerprint[0]]
+    return [mtime_ns for part in fingerprint for mtime_ns in get_mtimes(part)]
+
+
+def is_racy(*fingerprints):
+    '''
+    was any of the fingerprinted files (or directories) changed so
+    recently that it could change again without its fingerprint
+    changing?
+
+    a file system only keeps mtimes to some granularity, and on some
+    (e.g. network file systems) that can be a second or two, so a
+    second change in the same "tick" leaves the mtime as it was.
+    nothing should be cached against a fingerprint until it is older
+    than "mtime_granularity" seconds (from the config, default 2)
+    '''
+    granularity_ns = int(Config.get_optional_config_item("mtime_granularity", 2) * 1e9)
+    now_ns = time.time_ns()
+    return any(
+        now_ns - mtime_ns < granularity_ns
+        for fingerprint in fingerprints
+        for mtime_ns in get_mtimes(fingerprint)
+    )
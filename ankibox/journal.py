@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# delete journal
+#
+# osgav 2023
+#
+
+
+import hashlib
+import json
+import logging
+import os
+
+from ankibox.app_config import Config
+from ankibox.atomic_write import write_atomically
+
+
+PHASE_PLANNED = "planned"
+PHASE_INTERMEDIARY_WRITTEN = "intermediary written"
+
+
+
+
+def get_title_hash(title):
+    return hashlib.blake2b(title.encode(), digest_size=8).hexdigest()
+
+
+def get_entry_key(anki_id, title):
+    '''
+    how a journal records an ankinote entry: its ID line and a
+    (short) hash of its title. entries are found again by the title
+    hash alone, the ID line is only there for the record (the
+    Obsidian_to_Anki plugin may change it when it runs the DELETE)
+    '''
+    return [anki_id, get_title_hash(title)]
+
+
+
+
+class DeleteJournal:
+    '''
+    an on-disk record of the delete operations in progress
+
+    the delete operation happens in two phases, with the user running
+    the Obsidian_to_Anki plugin in between. before the first write the
+    planned delete is recorded here (for each ankibox: its ankinote,
+    the entries being deleted and how far it got), and the record is
+    only removed once the final ankinote has been written
+
+    so if ankibox dies, or is stopped, part way through, --resume-delete
+    can finish the job from the journal and the ankinote alone, without
+    snapshotting the source, looking notes up or reading any of them
+
+    the journal is small and only written at the start and end of each
+    phase, so it is simply rewritten (atomically) every time
+    '''
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = os.path.join(Config.get_config_dir(), "delete_journal.json")
+
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.log.warning("delete journal \"{}\" is unreadable, ignoring it".format(self.path))
+            return {}
+
+
+    def save(self, journal):
+        if journal:
+            write_atomically(self.path, [json.dumps(journal, indent=1)])
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def get(self, name):
+        return self.load().get(name)
+
+
+    def plan(self, name, ankinote_path, entry_keys):
+        journal = self.load()
+        journal[name] = {
+            'ankinote': ankinote_path,
+            'phase': PHASE_PLANNED,
+            'entries': entry_keys,
+        }
+        self.save(journal)
+
+
+    def set_phase(self, name, phase):
+        journal = self.load()
+        journal[name]['phase'] = phase
+        self.save(journal)
+
+
+    def remove(self, name):
+        journal = self.load()
+        if journal.pop(name, None) is not None:
+            self.save(journal)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# file locations
+#
+# osgav 2023
+#
+# (nothing is imported here, so the thin client can find
+# the daemon's socket without loading the rest of ankibox)
+#
+
+
+CONFIG_PATH = "/home/doj/.ankibox/config.toml" # HARDCODED VALUE ...
+# CONFIG_PATH = "./ankiboxtestvault-config.toml" # HARDCODED VALUE ...
+
+SOCKET_NAME = "ankibox.sock"    # in the same directory as the config file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# profiling (--profile)
+#
+# osgav 2023
+#
+
+
+import contextlib
+import cProfile
+import logging
+import threading
+import time
+import tracemalloc
+
+
+
+
+class Profiler:
+    '''
+    lightweight per-phase timers and counters for --profile
+
+    any class can time a phase or bump a counter without being handed
+    a profiler. until a Profiler is instantiated it is disabled, and phase() and
+    count() do nothing but check a flag:
+
+        with Profiler.phase("TESTBOX", "ankinote snapshot"):
+            ...
+        Profiler.count("notes read")
+
+    optionally the whole run can also be recorded with cProfile
+    and/or tracemalloc, and dumped to a file by report()
+    '''
+
+    enabled = False
+    _phases = None
+    _counters = None
+    _lock = threading.Lock()
+    _cprofile = None
+    _cprofile_path = None
+    _tracemalloc_path = None
+    _null = contextlib.nullcontext()
+
+    def __init__(self, cprofile_path=None, tracemalloc_path=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        Profiler.enabled = True
+        Profiler._phases = {}
+        Profiler._counters = {}
+        Profiler._cprofile_path = cprofile_path
+        Profiler._tracemalloc_path = tracemalloc_path
+
+        if cprofile_path:
+            Profiler._cprofile = cProfile.Profile()
+            Profiler._cprofile.enable()
+        if tracemalloc_path:
+            tracemalloc.start()
+        self.log.debug("profiling enabled.")
+
+
+    @staticmethod
+    def phase(box, name):
+        '''
+        a context manager timing one phase (of one ankibox, or None)
+        '''
+        if not Profiler.enabled:
+            return Profiler._null
+        return Profiler._timer((box, name))
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _timer(key):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with Profiler._lock:
+                calls, seconds = Profiler._phases.get(key, (0, 0.0))
+                Profiler._phases[key] = (calls + 1, seconds + elapsed)
+
+
+    @staticmethod
+    def count(name, n=1):
+        if not Profiler.enabled:
+            return
+        with Profiler._lock:
+            Profiler._counters[name] = Profiler._counters.get(name, 0) + n
+
+
+    @staticmethod
+    def report():
+        '''
+        print the phase timings and counters, and write the
+        cProfile / tracemalloc dumps if they were asked for
+        '''
+        if not Profiler.enabled:
+            return
+
+        if Profiler._cprofile:
+            Profiler._cprofile.disable()
+            Profiler._cprofile.dump_stats(Profiler._cprofile_path)
+        if Profiler._tracemalloc_path:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(Profiler._tracemalloc_path, "w") as f:
+                f.write("current: {} bytes, peak: {} bytes\n\n".format(current, peak))
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write("{}\n".format(stat))
+
+        print("\n---> profile {}".format("-" * 64))
+        print("")
+        print("{:<48} {:>6} {:>12}".format("phase", "calls", "seconds"))
+        for (box, name), (calls, seconds) in Profiler._phases.items():
+            label = "{} / {}".format(box, name) if box else name
+            print("{:<48} {:>6} {:>12.4f}".format(label, calls, seconds))
+        print("")
+        print("{:<48} {:>19}".format("counter", "count"))
+        for name, count in sorted(Profiler._counters.items()):
+            print("{:<48} {:>19}".format(name, count))
+        if Profiler._cprofile_path:
+            print("\ncProfile stats written to {}".format(Profiler._cprofile_path))
+        if Profiler._tracemalloc_path:
+            print("tracemalloc report written to {}".format(Profiler._tracemalloc_path))
+        print("")
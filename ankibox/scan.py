@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# file system scanning
+#
+# osgav 2023
+#
+
+
+import os
+import stat
+from typing import NamedTuple
+
+
+
+
+class ScanEntry(NamedTuple):
+    '''
+    one entry of a directory listing
+    '''
+    name: str
+    is_dir: bool
+    is_symlink: bool
+
+
+class PathInfo(NamedTuple):
+    '''
+    what a single stat of a path says about it
+    '''
+    is_dir: bool
+    is_file: bool
+    fingerprint: tuple      # (mtime_ns, size)
+
+
+
+
+def scan_directory(path):
+    '''
+    list a directory with os.scandir, returning a ScanEntry per entry
+
+    the type of each entry comes with the listing itself (on linux,
+    from the d_type the kernel returns) so, unlike os.listdir followed
+    by os.path.isdir, it costs no extra syscall per entry
+
+    raises OSError if the directory can't be listed
+    '''
+    entries = []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            entries.append(ScanEntry(entry.name, is_dir, entry.is_symlink()))
+    return entries
+
+
+def stat_path(path):
+    '''
+    stat a path once, and answer isdir / isfile / get_fingerprint
+    from that one stat (instead of a syscall for each question)
+
+    returns None if there is nothing at the path
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return PathInfo(
+        is_dir=stat.S_ISDIR(st.st_mode),
+        is_file=stat.S_ISREG(st.st_mode),
+        fingerprint=(st.st_mtime_ns, st.st_size),
+    )
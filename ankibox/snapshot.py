@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# columnar snapshots
+#
+# osgav 2023
+#
+
+
+import re
+import sys
+from array import array
+
+
+ANKI_ID_PATTERN = re.compile(r"^<!--ID: (\d+)-->$")
+
+
+
+
+class PackedStrings:
+    '''
+    a list of strings packed end to end (utf-8 encoded) into one
+    shared buffer, with an array of offsets marking where each one
+    starts and ends. no str object is kept per string, they are
+    only decoded again when one is asked for
+    '''
+
+    __slots__ = ('_buffer', '_offsets')
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('Q', [0])
+
+    def append(self, string):
+        self._buffer += string.encode()
+        self._offsets.append(len(self._buffer))
+
+    def __getitem__(self, slot):
+        return self._buffer[self._offsets[slot]:self._offsets[slot + 1]].decode()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+
+
+class Snapshot:
+    '''
+    a snapshot of the notes in a source or an ankinote, stored by column:
+
+    - titles: a list of interned strings (the diff hashes these)
+    - anki_ids: an array of Obsidian_to_Anki IDs (0 = no ID yet)
+    - the filepath and card back of each ankinote entry, packed
+      into one shared string buffer
+
+    Note objects are only built for the rows that are actually used
+    (e.g. the new notes in an add), and each one is built once
+
+    a Snapshot is a read-only sequence of Notes once frozen
+    '''
+
+    __slots__ = ('source', 'titles', 'anki_ids', '_strings', '_odd_ids', '_notes')
+
+    def __init__(self, source):
+        '''
+        the "source" is the same as a Note's: "markdown_file" or "ankinote"
+        '''
+        self.source = source
+        self.titles = []
+        self.anki_ids = array('q')
+        self._strings = PackedStrings()
+        self._odd_ids = {}      # row -> ID line that doesn't fit ANKI_ID_PATTERN
+        self._notes = {}        # row -> Note, built on first access
+
+
+    def append(self, title, filepath=None, card_back=None, obsidian_to_anki_id=None):
+        row = len(self.titles)
+        self.titles.append(sys.intern(title))
+
+        if self.source == "ankinote":
+            self._strings.append(filepath or "")
+            self._strings.append(card_back or "")
+
+        if obsidian_to_anki_id is None:
+            self.anki_ids.append(0)
+        else:
+            match = ANKI_ID_PATTERN.match(obsidian_to_anki_id)
+            if match:
+                self.anki_ids.append(int(match.group(1)))
+            else:
+                self.anki_ids.append(-1)
+                self._odd_ids[row] = obsidian_to_anki_id
+
+
+    def freeze(self):
+        '''
+        done appending: the titles become a tuple, so the
+        snapshot can't be changed after it has been diffed
+        '''
+        self.titles = tuple(self.titles)
+        return self
+
+
+    def __len__(self):
+        return len(self.titles)
+
+
+    def __iter__(self):
+        for row in range(len(self.titles)):
+            yield self.note(row)
+
+
+    def __getitem__(self, row):
+        return self.note(row)
+
+
+    def anki_id(self, row):
+        '''
+        the ID line as it appears in the ankinote, or None
+        '''
+        anki_id = self.anki_ids[row]
+        if anki_id == 0:
+            return None
+        if anki_id == -1:
+            return self._odd_ids[row]
+        return "<!--ID: {}-->".format(anki_id)
+
+
+    def note(self, row):
+        '''
+        the Note for a row (built the first time it is asked for)
+        '''
+        from ankibox.ankibox import Note
+
+        note = self._notes.get(row)
+        if note is None:
+            if self.source == "ankinote":
+                details = {
+                    'filepath': self._strings[2 * row] or None,
+                    'card_back': self._strings[2 * row + 1],
+                    'obsidian_to_anki_id': self.anki_id(row),
+                }
+                note = Note(self.titles[row], source="ankinote", ankinote=details)
+            else:
+                note = Note(self.titles[row], source=self.source)
+            self._notes[row] = note
+        return note
+
+
+    def notes(self, rows):
+        return tuple(self.note(row) for row in rows)
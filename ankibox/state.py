@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# AnkiBox state (diff engine)
+#
+# osgav 2023
+#
+
+
+from array import array
+from typing import NamedTuple
+
+
+
+
+class AnkiBoxState(NamedTuple):
+    '''
+    the state of an AnkiBox: its two snapshots and the partitions
+    of those snapshots that the summary, add and delete operations
+    work from
+
+    the partitions are arrays of row numbers into the (columnar)
+    snapshots, kept in snapshot order. counts and titles come
+    straight from the columns, Notes are only built when a
+    partition's notes are asked for
+    '''
+    snapshot_source: object
+    snapshot_ankinote: object
+    titles_source_all: frozenset
+    rows_source_new: array              # in source, not in ankinote
+    rows_ankinote_old: array            # in ankinote, not in source
+    rows_ankinote_kept: array           # in ankinote, still in source
+    rows_ankinote_missing_id: array     # in ankinote, no Obsidian_to_Anki ID yet
+
+    @property
+    def count_source_total(self):
+        return len(self.snapshot_source)
+
+    @property
+    def count_ankinote_total(self):
+        return len(self.snapshot_ankinote)
+
+    @property
+    def count_source_new(self):
+        return len(self.rows_source_new)
+
+    @property
+    def count_ankinote_old(self):
+        return len(self.rows_ankinote_old)
+
+    @property
+    def count_ankinote_anki_ids(self):
+        return len(self.snapshot_ankinote) - len(self.rows_ankinote_missing_id)
+
+    @property
+    def titles_source_new(self):
+        return [self.snapshot_source.titles[row] for row in self.rows_source_new]
+
+    @property
+    def titles_ankinote_old(self):
+        return [self.snapshot_ankinote.titles[row] for row in self.rows_ankinote_old]
+
+    @property
+    def notes_source_new(self):
+        return self.snapshot_source.notes(self.rows_source_new)
+
+    @property
+    def notes_ankinote_old(self):
+        return self.snapshot_ankinote.notes(self.rows_ankinote_old)
+
+    @property
+    def notes_ankinote_kept(self):
+        return self.snapshot_ankinote.notes(self.rows_ankinote_kept)
+
+    @property
+    def notes_ankinote_missing_id(self):
+        return self.snapshot_ankinote.notes(self.rows_ankinote_missing_id)
+
+
+
+
+def diff_snapshots(snapshot_source, snapshot_ankinote):
+    '''
+    compare a source snapshot with an ankinote snapshot
+
+    the title columns are collected into sets first, so each row
+    is then partitioned with a single hashed lookup, and the whole
+    diff is linear in the size of the two snapshots
+    '''
+    titles_source = snapshot_source.titles
+    titles_ankinote = snapshot_ankinote.titles
+    anki_ids = snapshot_ankinote.anki_ids
+
+    titles_source_all = frozenset(titles_source)
+    titles_ankinote_all = frozenset(titles_ankinote)
+
+    rows_source_new = array('l', (
+        row for row, title in enumerate(titles_source) if title not in titles_ankinote_all
+    ))
+
+    rows_ankinote_old = array('l')
+    rows_ankinote_kept = array('l')
+    rows_ankinote_missing_id = array('l')
+    for row, title in enumerate(titles_ankinote):
+        if title in titles_source_all:
+            rows_ankinote_kept.append(row)
+        else:
+            rows_ankinote_old.append(row)
+        if not anki_ids[row]:
+            rows_ankinote_missing_id.append(row)
+
+    return AnkiBoxState(
+        snapshot_source=snapshot_source,
+        snapshot_ankinote=snapshot_ankinote,
+        titles_source_all=titles_source_all,
+        rows_source_new=rows_source_new,
+        rows_ankinote_old=rows_ankinote_old,
+        rows_ankinote_kept=rows_ankinote_kept,
+        rows_ankinote_missing_id=rows_ankinote_missing_id,
+    )
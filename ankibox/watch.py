@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# watch mode (--watch)
+#
+# osgav 2023
+#
+
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+from ankibox.cache import CardBackCache
+from ankibox.cache import IWQueueCache
+from ankibox.cache import SummaryCache
+from ankibox.fingerprint import get_fingerprint
+
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+
+
+
+
+class InotifyBackend:
+    '''
+    change detection with inotify (linux only), called through ctypes
+
+    the directories holding each source and ankinote are watched
+    (rather than the files themselves, since editors and
+    write_atomically replace files instead of writing into them)
+    '''
+    def __init__(self, paths):
+        self.log = logging.getLogger(self.__class__.__name__)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        dirs = {path if os.path.isdir(path) else os.path.dirname(path) for path in paths}
+        for dir in sorted(dirs):
+            if libc.inotify_add_watch(self.fd, dir.encode(), IN_WATCH_MASK) < 0:
+                self.log.debug("could not watch \"{}\"".format(dir))
+        self.log.debug("watching {} directories with inotify".format(len(dirs)))
+
+
+    def wait(self, timeout):
+        '''
+        block until something changes (True) or the timeout passes (False)
+        '''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+
+
+
+class PollingBackend:
+    '''
+    change detection by polling the (mtime_ns, size) of each source
+    and ankinote every "interval" seconds: one stat per path
+    '''
+    def __init__(self, paths, interval):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.paths = sorted(set(paths))
+        self.interval = interval
+        self.fingerprints = self.get_fingerprints()
+        self.log.debug("polling {} paths every {}s".format(len(self.paths), interval))
+
+
+    def get_fingerprints(self):
+        return [get_fingerprint(path) for path in self.paths]
+
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.interval, remaining))
+            fingerprints = self.get_fingerprints()
+            if fingerprints != self.fingerprints:
+                self.fingerprints = fingerprints
+                return True
+
+
+
+
+class Watcher:
+    '''
+    keep watching the ankiboxes and print their new/old counts live
+
+    when something changes, the watcher waits until the changes
+    stop for "debounce" seconds (so a burst of edits is handled
+    once), then recomputes and prints the state of only the
+    ankiboxes whose source or ankinote fingerprint changed. with
+    --watch-add, new notes are added to the ankinote straight away
+
+    like the daemon, the VaultIndex is expired before each update,
+    so notes created since the last one can be found (only the
+    directories that changed are listed again)
+    '''
+    def __init__(self, ankiboxes, cli_args):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.ankiboxes = ankiboxes
+        self.auto_add = cli_args.watch_add
+        self.debounce = cli_args.debounce
+
+        paths = []
+        for ankibox in ankiboxes:
+            ankibox.interactive = False
+            paths.append(ankibox.source.source_path)
+            paths.extend(ankibox.ankinote.get_paths())
+
+        try:
+            self.backend = InotifyBackend(paths)
+        except (OSError, AttributeError) as e:
+            self.log.debug("inotify not available ({}), polling instead".format(e))
+            self.backend = PollingBackend(paths, cli_args.watch_interval)
+
+
+    def run(self):
+        from ankibox.ankibox import VaultIndex
+
+        fingerprints = {}
+        print("")
+        for ankibox in self.ankiboxes:
+            self.update(ankibox)
+            fingerprints[ankibox.name] = ankibox.get_fingerprint()
+        print("\nwatching {} ankiboxes, press <CTRL-C> to stop...".format(len(self.ankiboxes)))
+
+        try:
+            while True:
+                if not self.backend.wait(None):
+                    continue
+                while self.backend.wait(self.debounce):
+                    pass
+
+                changed = [
+                    ankibox for ankibox in self.ankiboxes
+                    if ankibox.get_fingerprint() != fingerprints[ankibox.name]
+                ]
+                if not changed:
+                    continue
+
+                print("\n[{}]".format(time.strftime("%H:%M:%S")))
+                VaultIndex.expire()
+                for ankibox in changed:
+                    self.update(ankibox)
+                    fingerprints[ankibox.name] = ankibox.get_fingerprint()
+                CardBackCache.save()
+                SummaryCache.save()
+                IWQueueCache.save()
+        except KeyboardInterrupt:
+            CardBackCache.save()
+            SummaryCache.save()
+            IWQueueCache.save()
+            print("")
+
+
+    def update(self, ankibox):
+        '''
+        print the state of one ankibox (and add its new notes, with
+        --watch-add). an error is logged and the watcher carries on,
+        so one broken ankibox doesn't stop the others being watched
+        '''
+        try:
+            ankibox.summary_short()
+            if self.auto_add and ankibox.get_state().count_source_new:
+                ankibox.add_new_notes()
+        except Exception as e:
+            self.log.error("could not update \"{}\": {}".format(ankibox.name, e))
+            self.log.debug("details:", exc_info=True)
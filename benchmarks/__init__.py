@@ -0,0 +1,7 @@
+#
+# ankibox benchmarks
+#
+# run from the repository root, e.g.
+#
+#   python -m benchmarks.ankinote_parse
+#
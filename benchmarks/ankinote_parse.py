@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# benchmark: ankinote parse speed
+#
+# osgav 2023
+#
+
+
+import argparse
+import os
+import tempfile
+import time
+
+from ankibox.ankinote_parser import parse_ankinote
+from benchmarks.generate import ANKI_CARD_TAG
+from benchmarks.generate import write_synthetic_ankinote
+
+
+
+
+def parse(path):
+    with open(path, "r") as f:
+        return sum(1 for entry in parse_ankinote(f, ANKI_CARD_TAG))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time parsing a synthetic ankinote")
+    parser.add_argument('--entries', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ANKIBOX.md")
+        write_synthetic_ankinote(path, args.entries)
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            count = parse(path)
+            timings.append(time.perf_counter() - start)
+
+    assert count == args.entries, "parsed {} of {} entries".format(count, args.entries)
+    best = min(timings)
+    print("parsed {} entries: best {:.3f}s of {} runs ({:.0f} entries/s)".format(
+          count, best, args.repeat, count / best))
+
+
+
+
+if __name__ == '__main__':
+    main()
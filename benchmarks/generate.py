@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# benchmark: synthetic vault generator
+#
+# osgav 2023
+#
+
+
+import os
+import random
+
+from ankibox.chunks import ankinote_chunk_header
+from ankibox.chunks import ankinote_chunk_first_line
+from ankibox.chunks import ankinote_chunk_first_line_with_id
+
+
+ANKI_CARD_TAG = "#0/anki/card"
+
+IW_QUEUE_HEADER = """---
+tags: iw-queue
+alias: benchmark queue
+---
+
+| Link | Priority | Notes | Interval | Next Rep |
+|------|----------|-------|----------|----------|
+"""
+
+
+
+
+def write_note(path, title, note_size):
+    '''
+    a note that starts the way real notes do (blank lines, a
+    "related:" list) and is padded out to roughly note_size bytes
+    '''
+    body = "\n\nrelated:\n- [[another note]]\n\nthe first line of {}\n".format(title)
+    padding = max(0, note_size - len(body))
+    with open(path, "w") as f:
+        f.write(body)
+        f.write(("lorem ipsum dolor sit amet " * (padding // 27 + 1))[:padding])
+
+
+def write_synthetic_ankinote(path, entries, name="BENCHMARK", with_ids=0.5, filepaths=None):
+    '''
+    write an ankinote with the given entries (titles, or a count),
+    with_ids is the fraction of entries that get an Obsidian_to_Anki ID
+    '''
+    if isinstance(entries, int):
+        entries = ["note {}".format(i) for i in range(entries)]
+    filepaths = filepaths or {}
+    with_id_every = round(1 / with_ids) if with_ids else 0
+    with open(path, "w") as f:
+        f.write(ankinote_chunk_header.format(ankibox_name=name))
+        for i, title in enumerate(entries):
+            details = dict(
+                filepath=filepaths.get(title, "/vault/notes/{}.md".format(title)),
+                anki_card_front=title,
+                anki_card_tag=ANKI_CARD_TAG,
+                anki_card_back="the first line of {}".format(title),
+            )
+            if with_id_every and i % with_id_every == 0:
+                f.write(ankinote_chunk_first_line_with_id.format(
+                    obsidian_to_anki_id="<!--ID: {}-->".format(1685461928651 + i), **details))
+            else:
+                f.write(ankinote_chunk_first_line.format(**details))
+
+
+def generate_vault(root, files=1000, depth=3, note_size=2048, iw_queue_length=200,
+                   folder_notes=500, with_ids=1.0, churn=0.05, seed=0):
+    '''
+    generate a synthetic vault under root, with:
+
+    - "files" notes spread over directories nested up to "depth" deep
+    - an inbox folder holding "folder_notes" notes (a Folder ankibox)
+    - an IW queue of "iw_queue_length" rows (a File ankibox)
+    - an ankinote for each ankibox, out of sync by "churn": that
+      fraction of notes is new in the source and the same number
+      of entries is old in the ankinote
+
+    returns a config dict, in the same shape as config.toml
+    '''
+    rng = random.Random(seed)
+    vault_root = os.path.join(root, "vault/")
+    inbox = os.path.join(vault_root, "0 INBOX")
+    ankinote_storage = os.path.join(vault_root, "2 AREAS", "_system", "ankinotes")
+    iw_queue = os.path.join(vault_root, "2 AREAS", "Writing", "IW-Queues", "IW-benchmark.md")
+    for dir in (inbox, ankinote_storage, os.path.dirname(iw_queue), os.path.join(inbox, "ankibox")):
+        os.makedirs(dir, exist_ok=True)
+
+    # the vault
+    filepaths = {}
+    for i in range(files):
+        parts = ["dir {}".format(rng.randrange(8)) for _ in range(rng.randint(1, depth))]
+        dir = os.path.join(vault_root, "3 RESOURCES", *parts)
+        os.makedirs(dir, exist_ok=True)
+        title = "vault note {}".format(i)
+        filepaths[title] = "{}/{}.md".format(dir, title)
+        write_note(filepaths[title], title, note_size)
+
+    # the Folder ankibox
+    folder_titles = []
+    for i in range(folder_notes):
+        title = "inbox note {}".format(i)
+        folder_titles.append(title)
+        filepaths[title] = "{}/{}.md".format(inbox, title)
+        write_note(filepaths[title], title, note_size)
+
+    # the IW queue ankibox
+    vault_titles = ["vault note {}".format(i) for i in range(files)]
+    queue_titles = rng.sample(vault_titles, min(iw_queue_length, files))
+    with open(iw_queue, "w") as f:
+        f.write(IW_QUEUE_HEADER)
+        for title in queue_titles:
+            f.write("| [[{}]] | {} | | 1 | 2023-06-01 |\n".format(title, rng.randint(1, 100)))
+
+    # the ankinotes
+    for titles, path in (
+        (folder_titles, os.path.join(inbox, "ankibox", "ANKIBOX.md")),
+        (queue_titles, os.path.join(ankinote_storage, "ANKIBOX IW benchmark.md")),
+    ):
+        changed = int(len(titles) * churn)
+        entries = titles[changed:] + ["removed note {}".format(i) for i in range(changed)]
+        write_synthetic_ankinote(path, entries, name=os.path.basename(path), with_ids=with_ids,
+                                 filepaths=filepaths)
+
+    return {
+        'anki_card_tag': ANKI_CARD_TAG,
+        'vault_root': vault_root,
+        'file_ankinote_storage': ankinote_storage,
+        'mtime_granularity': 0,     # the vault is used as soon as it's written
+        'folder': [{'name': "BENCHBOX", 'path': inbox + "/"}],
+        'file': [{'name': "IW benchmark", 'path': iw_queue, 'type': "IWQueue"}],
+    }
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# benchmark: time each stage of an ankibox run against a synthetic vault
+#
+# osgav 2023
+#
+# usage (from the repository root):
+#
+#   python -m benchmarks.run --files 20000 --output before.json
+#   ... change something ...
+#   python -m benchmarks.run --files 20000 --output after.json --compare before.json
+#
+
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from ankibox.app_config import Config
+from ankibox.ankibox import AnkiBox
+from ankibox.ankibox import AnkiNote
+from ankibox.ankibox import Folder
+from ankibox.ankibox import IWQueue
+from ankibox.ankibox import VaultIndex
+from benchmarks.generate import generate_vault
+
+
+
+
+def make_ankibox(config, source_type):
+    if source_type == "folder":
+        source = Folder(config)
+    else:
+        source = IWQueue(config)
+    ankinote = AnkiNote(config, source_type)
+    action = argparse.Namespace(add=False, delete=False, summary=True)
+    return AnkiBox(config['name'], action, ankinote, source)
+
+
+def get_stages(config):
+    '''
+    each stage is (name, setup, stage): setup() runs untimed and
+    returns the argument that the timed stage() is called with
+    '''
+    folder = config['folder'][0]
+    file = config['file'][0]
+    index_cache = os.path.join(Config.get_config_dir(), "vault_index.json")
+
+    def drop_index_cache():
+        if os.path.exists(index_cache):
+            os.remove(index_cache)
+
+    # only the entries still in the source can be rendered,
+    # the removed notes have no file to read the card back from
+    def rendered_chunks():
+        ankibox = make_ankibox(folder, "folder")
+        notes = ankibox.get_state().notes_ankinote_kept
+        return ankibox.ankinote, ankibox.render_chunks(notes), [note.title for note in notes]
+
+    return [
+        ("vault_index_cold", drop_index_cache, lambda _: VaultIndex()),
+        ("vault_index_cached", lambda: None, lambda _: VaultIndex()),
+        ("folder_snapshot", lambda: Folder(folder), lambda source: source.get_snapshot()),
+        ("iwqueue_snapshot", lambda: IWQueue(file), lambda source: source.get_snapshot()),
+        ("ankinote_snapshot", lambda: AnkiNote(folder, "folder"), lambda ankinote: ankinote.get_snapshot()),
+        ("get_state_folder", lambda: make_ankibox(folder, "folder"), lambda ankibox: ankibox.get_state()),
+        ("get_state_iwqueue", lambda: make_ankibox(file, "file"), lambda ankibox: ankibox.get_state()),
+        ("render_chunks", lambda: make_ankibox(folder, "folder"),
+            lambda ankibox: ankibox.render_chunks(ankibox.get_state().notes_ankinote_kept)),
+        ("write_chunks_to_ankinote", rendered_chunks,
+            lambda prepared: prepared[0].write_chunks_to_ankinote(prepared[1], prepared[2])),
+    ]
+
+
+def run_stage(setup, stage, repeat):
+    '''
+    best wall time over "repeat" runs, then one more
+    run under tracemalloc for the peak memory
+    '''
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        stage(argument)
+        timings.append(time.perf_counter() - start)
+
+    argument = setup()
+    tracemalloc.start()
+    stage(argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'seconds': min(timings), 'peak_bytes': peak}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print("")
+    print("{:<28} {:>12} {:>12} {:>8}   {:>12} {:>12} {:>8}".format(
+          "stage", "base s", "this s", "ratio", "base peak", "this peak", "ratio"))
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        print("{:<28} {:>12.4f} {:>12.4f} {:>8.2f}   {:>12} {:>12} {:>8.2f}".format(
+              name,
+              base['seconds'], stage['seconds'], stage['seconds'] / max(base['seconds'], 1e-9),
+              base['peak_bytes'], stage['peak_bytes'], stage['peak_bytes'] / max(base['peak_bytes'], 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark each stage of an ankibox run")
+    parser.add_argument('--files', type=int, default=5000, help='notes in the vault')
+    parser.add_argument('--depth', type=int, default=3, help='max directory depth')
+    parser.add_argument('--note-size', type=int, default=2048, help='bytes per note')
+    parser.add_argument('--iw-queue-length', type=int, default=1000, help='rows in the IW queue')
+    parser.add_argument('--folder-notes', type=int, default=2000, help='notes in the Folder ankibox')
+    parser.add_argument('--with-ids', type=float, default=1.0,
+                        help='fraction of ankinote entries with an Obsidian_to_Anki ID')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare the results with an earlier JSON file')
+    args = parser.parse_args()
+
+    params = {
+        'files': args.files,
+        'depth': args.depth,
+        'note_size': args.note_size,
+        'iw_queue_length': args.iw_queue_length,
+        'folder_notes': args.folder_notes,
+        'with_ids': args.with_ids,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = generate_vault(tmp, **params)
+        Config._config = config
+        Config._config_path = os.path.join(tmp, "config.toml")
+        VaultIndex()
+
+        stages = {}
+        for name, setup, stage in get_stages(config):
+            stages[name] = run_stage(setup, stage, args.repeat)
+            print("{:<28} {:>10.4f}s {:>12} bytes peak".format(
+                  name, stages[name]['seconds'], stages[name]['peak_bytes']))
+
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'params': params,
+        'stages': stages,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+
+
+if __name__ == '__main__':
+    main()
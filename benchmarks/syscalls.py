@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# benchmark: count the file system calls made by each stage of an ankibox run
+#
+# osgav 2023
+#
+# usage (from the repository root):
+#
+#   python -m benchmarks.syscalls --files 20000
+#
+# the calls are counted at the python level, by wrapping the os and
+# io functions that each make (at least) one system call: stat, lstat,
+# open, listdir, scandir and DirEntry.stat. running the same stages
+# under "strace -f -c" gives the kernel's view of it, where that is
+# available
+#
+
+
+import argparse
+import builtins
+import io
+import os
+import tempfile
+from collections import Counter
+
+from ankibox.app_config import Config
+from ankibox.app_config import ConfigValidator
+from ankibox.ankibox import AnkiNote
+from ankibox.ankibox import VaultIndex
+from ankibox.cache import CardBackCache
+from benchmarks.generate import generate_vault
+from benchmarks.run import make_ankibox
+
+
+
+
+class CountedDirEntry:
+    '''
+    a DirEntry whose stat() is counted (is_dir() etc. are
+    answered from the directory listing, so cost nothing)
+    '''
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+
+    def stat(self, *args, **kwargs):
+        self._counter['DirEntry.stat'] += 1
+        return self._entry.stat(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def __fspath__(self):
+        return self._entry.path
+
+
+
+
+class CountedScandir:
+    def __init__(self, iterator, counter):
+        self._iterator = iterator
+        self._counter = counter
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return CountedDirEntry(next(self._iterator), self._counter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._iterator.close()
+
+    def close(self):
+        self._iterator.close()
+
+
+
+
+class SyscallCounter:
+    '''
+    while active, count the calls made to the wrapped functions
+    '''
+    def __init__(self):
+        self.counter = Counter()
+        self.originals = {}
+
+    def wrap(self, module, name, wrapper):
+        self.originals[(module, name)] = getattr(module, name)
+        setattr(module, name, wrapper)
+
+    def __enter__(self):
+        counter = self.counter
+        stat, lstat, listdir, scandir, open_ = os.stat, os.lstat, os.listdir, os.scandir, io.open
+
+        def counted(name, function):
+            def wrapper(*args, **kwargs):
+                counter[name] += 1
+                return function(*args, **kwargs)
+            return wrapper
+
+        self.wrap(os, 'stat', counted('stat', stat))
+        self.wrap(os, 'lstat', counted('lstat', lstat))
+        self.wrap(os, 'listdir', counted('listdir', listdir))
+        self.wrap(os, 'scandir', lambda *args: (
+            counter.update(['scandir']) or CountedScandir(scandir(*args), counter)
+        ))
+        self.wrap(builtins, 'open', counted('open', open_))
+        self.wrap(io, 'open', counted('open', open_))
+        return self
+
+    def __exit__(self, *exc):
+        for (module, name), original in self.originals.items():
+            setattr(module, name, original)
+
+
+
+
+def get_stages(config):
+    '''
+    each stage is (name, setup, stage), as in benchmarks.run
+    '''
+    folder = config['folder'][0]
+    file = config['file'][0]
+    index_cache = os.path.join(Config.get_config_dir(), "vault_index.json")
+
+    def drop_index_cache():
+        if os.path.exists(index_cache):
+            os.remove(index_cache)
+
+    def render_kept(ankibox):
+        CardBackCache.get_cache().clear()
+        return ankibox.render_chunks(ankibox.get_state().notes_ankinote_kept)
+
+    return [
+        ("config_validate", lambda: ConfigValidator(config), lambda v: v.validate_config()),
+        ("vault_index_cold", drop_index_cache, lambda _: VaultIndex()),
+        ("vault_index_cached", lambda: None, lambda _: VaultIndex()),
+        ("ankinote_init", lambda: None, lambda _: AnkiNote(folder, "folder")),
+        ("get_state_folder", lambda: make_ankibox(folder, "folder"), lambda ankibox: ankibox.get_state()),
+        ("get_state_iwqueue", lambda: make_ankibox(file, "file"), lambda ankibox: ankibox.get_state()),
+        ("summary_short_folder", lambda: make_ankibox(folder, "folder"), lambda ankibox: ankibox.summary_short()),
+        ("render_chunks_uncached", lambda: make_ankibox(folder, "folder"), render_kept),
+        ("render_chunks_cached", lambda: make_ankibox(folder, "folder"),
+            lambda ankibox: ankibox.render_chunks(ankibox.get_state().notes_ankinote_kept)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="count the file system calls of each stage of an ankibox run")
+    parser.add_argument('--files', type=int, default=5000, help='notes in the vault')
+    parser.add_argument('--depth', type=int, default=3, help='max directory depth')
+    parser.add_argument('--iw-queue-length', type=int, default=1000, help='rows in the IW queue')
+    parser.add_argument('--folder-notes', type=int, default=2000, help='notes in the Folder ankibox')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = generate_vault(
+            tmp,
+            files=args.files,
+            depth=args.depth,
+            iw_queue_length=args.iw_queue_length,
+            folder_notes=args.folder_notes,
+        )
+        Config._config = config
+        Config._config_path = os.path.join(tmp, "config.toml")
+        CardBackCache()
+        VaultIndex()
+
+        names = ['stat', 'lstat', 'open', 'listdir', 'scandir', 'DirEntry.stat']
+        print("{:<28}".format("stage") + "".join("{:>14}".format(name) for name in names) + "{:>10}".format("total"))
+        for name, setup, stage in get_stages(config):
+            argument = setup()
+            with SyscallCounter() as counter:
+                stage(argument)
+            counts = counter.counter
+            print("{:<28}".format(name)
+                  + "".join("{:>14}".format(counts[call]) for call in names)
+                  + "{:>10}".format(sum(counts.values())))
+
+
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ setup(
     entry_points=(
         """
         [console_scripts]
-        ankibox = ankibox.ankibox:main
+        ankibox = ankibox.client:main
         """
     )
 )
\ No newline at end of file
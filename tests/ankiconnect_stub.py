@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# a stub AnkiConnect server, for the AnkiConnect backend tests
+#
+# osgav 2023
+#
+
+
+import html
+import http.server
+import json
+import re
+import threading
+
+
+
+
+class AnkiConnectStub:
+    '''
+    just enough of AnkiConnect (createDeck, addNotes, findNotes,
+    updateNoteFields, deleteNotes and multi) to run ankibox's
+    AnkiConnect backend against, on a local port
+
+    notes live in a dict of note ID -> {deck, front, back}. a note
+    with the same front as one already in its deck is a duplicate.
+    how addNotes reports duplicates depends on batch_errors: a null
+    for each one (older versions of AnkiConnect), or one error for
+    the whole batch, after adding every other note (newer ones)
+
+    every connection and request is counted, and every action is
+    recorded (with the number of notes, for addNotes and deleteNotes)
+    '''
+    def __init__(self, batch_errors=False):
+        self.batch_errors = batch_errors
+        self.notes = {}
+        self.next_id = 1000
+        self.connections = 0
+        self.requests = 0
+        self.actions = []
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub.lock:
+                    stub.requests += 1
+                    reply = stub.reply(request['action'], request.get('params', {}))
+                body = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def reply(self, action, params):
+        try:
+            return {'result': self.run(action, params), 'error': None}
+        except ValueError as e:
+            return {'result': None, 'error': str(e)}
+
+
+    def run(self, action, params):
+        if action == "multi":
+            return [self.reply(a['action'], a.get('params', {})) for a in params['actions']]
+
+        if action == "createDeck":
+            self.actions.append((action,))
+            return 1
+
+        if action == "addNotes":
+            self.actions.append((action, len(params['notes'])))
+            ids = []
+            for note in params['notes']:
+                front, back = note['fields']['Front'], note['fields']['Back']
+                if self.find(note['deckName'], front):
+                    ids.append(None)
+                    continue
+                self.notes[self.next_id] = {'deck': note['deckName'], 'front': front, 'back': back}
+                ids.append(self.next_id)
+                self.next_id += 1
+            if self.batch_errors and None in ids:
+                raise ValueError("cannot create note because it is a duplicate")
+            return ids
+
+        if action == "findNotes":
+            self.actions.append((action,))
+            match = re.fullmatch(r'deck:"((?:[^"\\]|\\.)*)" "Front:((?:[^"\\]|\\.)*)"', params['query'])
+            deck, front = (re.sub(r"\\(.)", r"\1", group) for group in match.groups())
+            return self.find(deck, front)
+
+        if action == "updateNoteFields":
+            self.actions.append((action,))
+            note = params['note']
+            self.notes[note['id']]['front'] = note['fields']['Front']
+            self.notes[note['id']]['back'] = note['fields']['Back']
+            return None
+
+        if action == "deleteNotes":
+            self.actions.append((action, len(params['notes'])))
+            for note_id in params['notes']:
+                self.notes.pop(note_id, None)
+            return None
+
+        raise ValueError("unsupported action")
+
+
+    def find(self, deck, front):
+        return [
+            note_id for note_id, note in self.notes.items()
+            if note['deck'] == deck and note['front'] == front
+        ]
+
+
+    def add(self, deck, front, back):
+        '''
+        a note added to Anki some other way (e.g. by an earlier run)
+        '''
+        self.notes[self.next_id] = {'deck': deck, 'front': html.escape(front), 'back': html.escape(back)}
+        self.next_id += 1
+        return self.next_id - 1
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# test fixtures
+#
+# osgav 2023
+#
+
+
+import json
+import re
+
+import pytest
+
+from ankibox import app_config
+from ankibox.ankibox import VaultIndex
+from ankibox.ankibox import get_parser
+from ankibox.app_config import Config
+
+
+
+
+def toml_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(toml_value(item) for item in value))
+    if isinstance(value, str):
+        return json.dumps(value)
+    return str(value)
+
+
+@pytest.fixture
+def vault(tmp_path):
+    '''
+    an empty vault directory
+    '''
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    return vault
+
+
+@pytest.fixture
+def inbox(vault):
+    '''
+    an empty folder for a folder ankibox, with its ankibox/ folder
+    (where its ankinote goes)
+    '''
+    inbox = vault / "inbox"
+    (inbox / "ankibox").mkdir(parents=True)
+    return inbox
+
+
+@pytest.fixture
+def give_ids():
+    '''
+    what the Obsidian_to_Anki plugin does after an add: an ID line
+    under each entry of an ankinote
+    '''
+    def give_ids(ankinote):
+        ids = iter(range(1000, 100000))
+        text = re.sub(r"(#anki/card\n[^\n]*\n)", lambda m: "{}<!--ID: {}-->\n".format(m.group(1), next(ids)),
+                      ankinote.read_bytes().decode())
+        ankinote.write_bytes(text.encode())
+    return give_ids
+
+
+@pytest.fixture
+def configure(tmp_path, vault, monkeypatch):
+    '''
+    write a config file for the vault and load it. call it with the
+    folder and file ankiboxes (name -> path) and any other config
+    items, e.g. configure(folders={"INBOX": inbox}, io_jobs=4).
+    box_items are set on every ankibox, e.g. box_items={"shards": 4}
+    '''
+    config_dir = tmp_path / "config"
+    config_dir.mkdir()
+    ankinote_storage = tmp_path / "ankinotes"
+    ankinote_storage.mkdir()
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(config_dir / "config.toml"))
+
+    def configure(folders=None, files=None, box_items=None, **items):
+        lines = [
+            "anki_card_tag = {}".format(toml_value("#anki/card")),
+            "vault_root = {}".format(toml_value("{}/".format(vault))),
+            "file_ankinote_storage = {}".format(
+                toml_value(items.pop("file_ankinote_storage", "{}/".format(ankinote_storage)))),
+        ]
+        for key, value in items.items():
+            lines.append("{} = {}".format(key, toml_value(value)))
+        lines.append("folder = []" if not folders else "")
+        lines.append("file = []" if not files else "")
+        box_lines = ["{} = {}".format(key, toml_value(value)) for key, value in (box_items or {}).items()]
+        for name, path in (folders or {}).items():
+            lines += ["[[folder]]", "name = {}".format(toml_value(name)), "path = {}".format(toml_value(str(path)))]
+            lines += box_lines
+        for name, path in (files or {}).items():
+            lines += ["[[file]]", "name = {}".format(toml_value(name)), "path = {}".format(toml_value(str(path))),
+                      'type = "IWQueue"']
+            lines += box_lines
+        (config_dir / "config.toml").write_text("\n".join(lines) + "\n")
+
+        args = get_parser().parse_args([])
+        Config(args)
+        VaultIndex.unload()
+        return args
+
+    yield configure
+    VaultIndex.unload()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# add operation tests
+#
+# osgav 2023
+#
+
+
+import builtins
+import re
+
+import pytest
+
+from ankiconnect_stub import AnkiConnectStub
+from ankibox.ankibox import App
+from ankibox.ankibox import VaultIndex
+from ankibox.ankibox import get_parser
+from ankibox.watch import Watcher
+
+
+
+
+def run(*argv):
+    # like the daemon does before each request, so notes created
+    # since the last run (in this same process) are found
+    VaultIndex.expire()
+    App(get_parser().parse_args(list(argv))).run()
+
+
+def get_titles(ankinote):
+    return re.findall(r"(?m)^(.+) #anki/card$", ankinote.read_text())
+
+
+@pytest.fixture
+def queue(vault, tmp_path, monkeypatch):
+    '''
+    an IW queue of 3 notes, one of which isn't in the vault
+    '''
+    for title in ("note 0", "note 1"):
+        (vault / "{}.md".format(title)).write_text("\nthe back of {}\n".format(title))
+    queue = vault / "queue.md"
+    queue.write_text("---\nqueue: true\n---\n| note | priority |\n|------|------|\n"
+                     "| [[note 0]] | 10 |\n| [[ghost]] | 20 |\n| [[note 1]] | 30 |\n")
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    return queue
+
+
+
+
+def test_missing_notes_are_not_added(queue, tmp_path, configure, caplog, capsys):
+    configure(files={"QUEUE": queue})
+    run("-a")
+
+    assert sorted(get_titles(tmp_path / "ankinotes" / "ANKIBOX QUEUE.md")) == ["note 0", "note 1"]
+    assert "\"ghost\" not found in the vault, not added" in caplog.text
+    assert "added 2 new notes." in capsys.readouterr().out
+
+
+def test_missing_notes_are_not_added_to_anki(queue, tmp_path, configure, caplog, capsys):
+    with AnkiConnectStub() as stub:
+        configure(files={"QUEUE": queue}, sync_backend="ankiconnect", ankiconnect_url=stub.url)
+        run("-a")
+
+    assert sorted(note['front'] for note in stub.notes.values()) == ["note 0", "note 1"]
+    assert sorted(get_titles(tmp_path / "ankinotes" / "ANKIBOX QUEUE.md")) == ["note 0", "note 1"]
+    assert "\"ghost\" not found in the vault, not added" in caplog.text
+    assert "added 2 new notes to Anki." in capsys.readouterr().out
+
+
+def test_watcher_carries_on_after_an_error(inbox, queue, configure, caplog, capsys):
+    '''
+    an error in one ankibox is logged, and the others are still updated
+    '''
+    (inbox / "note 2.md").write_text("\nthe back of note 2\n")
+    args = configure(folders={"INBOX": "{}/".format(inbox)}, files={"QUEUE": queue})
+    args.watch_add = True
+    ankiboxes = App(args).get_ankiboxes()
+    watcher = Watcher(ankiboxes, args)
+
+    def broken():
+        raise OSError("disk on fire")
+    ankiboxes[0].summary_short = broken
+    for ankibox in ankiboxes:
+        watcher.update(ankibox)
+
+    assert "could not update \"INBOX\": disk on fire" in caplog.text
+    assert not (inbox / "ankibox" / "ANKIBOX.md").exists()
+    assert "added 2 new notes." in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("rewrite", [False, True])
+def test_new_notes_go_last(inbox, configure, monkeypatch, rewrite):
+    '''
+    whether the new notes are appended or the whole ankinote is
+    rewritten (because an existing entry changed), they go after the
+    existing entries
+    '''
+    for i in range(3):
+        (inbox / "note {}.md".format(i)).write_text("\nthe back of note {}\n".format(i))
+    configure(folders={"INBOX": "{}/".format(inbox)})
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    run("-a")
+    ankinote = inbox / "ankibox" / "ANKIBOX.md"
+    existing = get_titles(ankinote)
+
+    (inbox / "note 3.md").write_text("\nthe back of note 3\n")
+    if rewrite:
+        (inbox / "note 1.md").write_text("\na new back for note 1\n")
+    run("-a")
+
+    assert get_titles(ankinote) == existing + ["note 3"]
+    assert ("a new back for note 1" in ankinote.read_text()) == rewrite
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# AnkiConnect backend tests (against a stub AnkiConnect server)
+#
+# osgav 2023
+#
+
+
+import builtins
+import re
+import socket
+
+import pytest
+
+from ankiconnect_stub import AnkiConnectStub
+from ankibox import ankiconnect
+from ankibox.ankibox import App
+from ankibox.ankibox import get_parser
+from ankibox.ankiconnect import AnkiConnect
+from ankibox.ankiconnect import AnkiConnectError
+
+
+
+
+def run(*argv):
+    App(get_parser().parse_args(list(argv))).run()
+
+
+def get_ids(ankinote):
+    '''
+    the note IDs written to the ankinote, by title
+    '''
+    return {
+        title: int(note_id)
+        for title, note_id in re.findall(r"(?m)^(note \d+) #anki/card\n[^\n]*\n<!--ID: (\d+)-->", ankinote.read_text())
+    }
+
+
+@pytest.fixture
+def stub():
+    with AnkiConnectStub() as stub:
+        yield stub
+
+
+@pytest.fixture
+def setup(inbox, configure, monkeypatch):
+    '''
+    an inbox of 5 notes, synced through the stub (2 notes per request)
+    '''
+    def setup(stub):
+        for i in range(5):
+            (inbox / "note {}.md".format(i)).write_text("\nthe back of note {}\n".format(i))
+        configure(folders={"INBOX": "{}/".format(inbox)}, sync_backend="ankiconnect",
+                  ankiconnect_url=stub.url, ankiconnect_batch_size=2)
+        monkeypatch.setattr(builtins, "input", lambda *args: "")
+        return inbox / "ankibox" / "ANKIBOX.md"
+    return setup
+
+
+
+
+def test_add_writes_the_ids_back(stub, setup):
+    ankinote = setup(stub)
+    run("-a")
+
+    assert [action for action in stub.actions if action[0] == "addNotes"] == [
+        ("addNotes", 2), ("addNotes", 2), ("addNotes", 1)
+    ]
+    ids = get_ids(ankinote)
+    assert sorted(ids) == ["note {}".format(i) for i in range(5)]
+    assert {note_id: stub.notes[note_id]['front'] for note_id in ids.values()} == {
+        note_id: title for title, note_id in ids.items()
+    }
+    assert stub.notes[ids["note 3"]]['back'] == "the back of note 3"
+
+
+def test_add_then_delete(stub, setup, inbox):
+    ankinote = setup(stub)
+    run("-a")
+    ids = get_ids(ankinote)
+    (inbox / "note 1.md").unlink()
+    (inbox / "note 4.md").unlink()
+    run("-d")
+
+    assert ("deleteNotes", 2) in stub.actions
+    assert sorted(stub.notes) == sorted(ids[title] for title in ("note 0", "note 2", "note 3"))
+    assert get_ids(ankinote) == {title: ids[title] for title in ("note 0", "note 2", "note 3")}
+
+
+def test_one_keep_alive_connection(stub, setup, inbox):
+    setup(stub)
+    run("-a")
+    (inbox / "note 1.md").unlink()
+    run("-d")
+
+    # createDeck, 3 addNotes, and deleteNotes, in each run's one connection
+    assert stub.requests == 5
+    assert stub.connections == 2
+
+
+@pytest.mark.parametrize("batch_errors", [False, True])
+def test_duplicates_are_found_again(setup, batch_errors):
+    '''
+    notes already in Anki (e.g. added by a run that died before it
+    wrote the IDs back) get the IDs of the notes already there,
+    however AnkiConnect reports the duplicates
+    '''
+    with AnkiConnectStub(batch_errors=batch_errors) as stub:
+        ankinote = setup(stub)
+        existing = stub.add("INBOX", "note 2", "the back of note 2")
+        run("-a")
+
+    ids = get_ids(ankinote)
+    assert sorted(ids) == ["note {}".format(i) for i in range(5)]
+    assert ids["note 2"] == existing
+    assert len(stub.notes) == 5
+    assert ("findNotes",) in stub.actions
+
+
+def test_unreachable(configure, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # nothing listens on the port now
+    configure(ankiconnect_url="http://127.0.0.1:{}".format(port), ankiconnect_retries=2)
+    delays = []
+    monkeypatch.setattr(ankiconnect.time, "sleep", delays.append)
+
+    with pytest.raises(AnkiConnectError, match="could not reach AnkiConnect"):
+        AnkiConnect().request("version")
+    assert delays == [0.5, 1.0]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# cache tests
+#
+# osgav 2023
+#
+
+
+import os
+import time
+
+from ankibox.cache import CardBackCache
+from ankibox.cache import ChunkHashCache
+from ankibox.fingerprint import get_fingerprint
+
+
+
+
+def write_note(path, text, age=0):
+    '''
+    write a note, and make it "age" seconds old
+    '''
+    path.write_text(text)
+    mtime = time.time() - age
+    os.utime(str(path), (mtime, mtime))
+    return get_fingerprint(str(path))
+
+
+
+
+def test_card_back_cache_skips_racy_fingerprints(vault, configure):
+    configure()
+    CardBackCache()
+    old = write_note(vault / "old.md", "\nold\n", age=60)
+    new = write_note(vault / "new.md", "\nnew\n")
+
+    CardBackCache.put(str(vault / "old.md"), old, "old")
+    CardBackCache.put(str(vault / "new.md"), new, "new")
+    assert CardBackCache.get(str(vault / "old.md"), old) == "old"
+    assert CardBackCache.get(str(vault / "new.md"), new) is None
+
+
+def test_chunk_hash_cache_skips_racy_fingerprints(vault, configure):
+    configure()
+    ChunkHashCache()
+    old = write_note(vault / "old.md", "\nold\n", age=60)
+    new = write_note(vault / "new.md", "\nnew\n")
+
+    ChunkHashCache.put("ANKIBOX.md", "old", old, "hash")
+    ChunkHashCache.put("ANKIBOX.md", "new", new, "hash")
+    assert ChunkHashCache.get("ANKIBOX.md", "old") == (old, "hash")
+    assert ChunkHashCache.get("ANKIBOX.md", "new") is None
+
+
+def test_chunk_hash_cache_forgets_entries_gone_from_the_ankinote(vault, configure):
+    configure()
+    ChunkHashCache()
+    fingerprint = write_note(vault / "note.md", "\nnote\n", age=60)
+    for title in ("a", "b", "c"):
+        ChunkHashCache.put("ANKIBOX.md", title, fingerprint, "hash")
+        ChunkHashCache.put("OTHER.md", title, fingerprint, "hash")
+
+    ChunkHashCache.retain("ANKIBOX.md", ["a", "c"])
+    ChunkHashCache.save()
+    ChunkHashCache()
+    assert ChunkHashCache.get("ANKIBOX.md", "b") is None
+    assert ChunkHashCache.get("ANKIBOX.md", "c") == (fingerprint, "hash")
+    assert ChunkHashCache.get("OTHER.md", "b") == (fingerprint, "hash")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# daemon tests
+#
+# osgav 2023
+#
+
+
+import json
+import os
+
+from ankibox.ankibox import get_parser
+from ankibox.daemon import AnkiBoxDaemon
+
+
+
+
+def get_summary(daemon):
+    response = daemon.handle_request(json.dumps({'argv': ["-s"]}))
+    assert response['status'] == "ok"
+    return response['output']
+
+
+def test_racy_state_is_not_served_again(vault, configure):
+    inbox = vault / "inbox"
+    inbox.mkdir()
+    for i in range(3):
+        (inbox / "note {}.md".format(i)).write_text("a note\n")
+    configure(folders={"INBOX": "{}/".format(inbox)})
+    parser = get_parser()
+    daemon = AnkiBoxDaemon(parser, parser.parse_args(["daemon"]))
+    assert "3 new" in get_summary(daemon)
+
+    # a new note, in the same mtime "tick" as the last one: the
+    # folder's fingerprint doesn't change
+    st = os.stat(str(inbox))
+    (inbox / "note 3.md").write_text("a note\n")
+    os.utime(str(inbox), ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(str(inbox)).st_size == st.st_size
+    assert "4 new" in get_summary(daemon)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# delete operation tests
+#
+# osgav 2023
+#
+
+
+import builtins
+import json
+import re
+
+import pytest
+
+from ankibox.ankibox import App
+from ankibox.ankibox import get_parser
+from ankibox.app_config import Config
+
+
+
+
+def run(*argv):
+    App(get_parser().parse_args(list(argv))).run()
+
+
+def get_journal():
+    try:
+        with open("{}/delete_journal.json".format(Config.get_config_dir())) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def crash(*args):
+    raise KeyboardInterrupt
+
+
+@pytest.fixture
+def deleting(inbox, configure, give_ids, monkeypatch):
+    '''
+    an inbox with 6 notes in its ankinote, 2 of which have since
+    been removed from the inbox: a delete crashed at the prompt, after
+    the intermediary ankinote (with the DELETEs) was written
+    '''
+    for i in range(6):
+        (inbox / "note {}.md".format(i)).write_text("\nthe back of note {}\n".format(i))
+    configure(folders={"INBOX": "{}/".format(inbox)})
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    run("-a")
+    ankinote = inbox / "ankibox" / "ANKIBOX.md"
+    give_ids(ankinote)
+    (inbox / "note 1.md").unlink()
+    (inbox / "note 4.md").unlink()
+
+    monkeypatch.setattr(builtins, "input", crash)
+    with pytest.raises(KeyboardInterrupt):
+        run("-d")
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    assert "INBOX" in get_journal()
+    return ankinote
+
+
+
+
+def test_resume_delete_after_a_crash(deleting):
+    assert deleting.read_text().count("DELETE") == 2
+    run("--resume-delete")
+
+    text = deleting.read_text()
+    assert "note 1" not in text and "note 4" not in text
+    assert all("note {}".format(i) in text for i in (0, 2, 3, 5))
+    assert "DELETE" not in text
+    assert get_journal() == {}
+
+
+def test_resume_delete_when_the_entries_are_already_gone(deleting, monkeypatch, capsys):
+    # e.g. the final ankinote was written, but the journal wasn't removed
+    text = deleting.read_text()
+    for block in re.findall(r"(?m)^note [14].*\n(?:.+\n)*", text):
+        text = text.replace(block, "")
+    deleting.write_text(text)
+    monkeypatch.setattr(builtins, "input", crash)
+
+    run("--resume-delete")
+    assert get_journal() == {}
+    assert deleting.read_text() == text
+    assert "delete operation completed." in capsys.readouterr().out
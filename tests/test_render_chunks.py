@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# chunk rendering tests
+#
+# osgav 2023
+#
+
+
+import builtins
+import os
+
+import pytest
+
+from ankibox.ankibox import App
+from ankibox.ankibox import get_parser
+from ankibox.app_config import Config
+
+
+
+
+def run(*argv):
+    App(get_parser().parse_args(list(argv))).run()
+
+
+def forget_card_backs():
+    '''
+    so the next run reads every note again, instead of using
+    the card backs cached by the last one
+    '''
+    path = os.path.join(Config.get_config_dir(), "card_back_cache.json")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@pytest.fixture
+def notes(inbox, monkeypatch):
+    '''
+    200 notes, with a mix of card backs (plain lines, leading blank
+    lines, a "related" block, a long line)
+    '''
+    for i in range(200):
+        if i % 4 == 0:
+            text = "\nthe back of note {}\n".format(i)
+        elif i % 4 == 1:
+            text = "\n\n\n\nnote {} starts after blank lines\nmore\n".format(i)
+        elif i % 4 == 2:
+            text = "\n\nrelated:\n```\nfirst line of note {}\n```\n".format(i)
+        else:
+            text = "{} is a long line. ".format(i) * 50 + "\n"
+        (inbox / "note {}.md".format(i)).write_text(text)
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    return inbox
+
+
+
+
+@pytest.mark.parametrize("io_jobs", [4, 16])
+def test_pooled_render_is_byte_identical(notes, configure, give_ids, monkeypatch, io_jobs):
+    ankinote = notes / "ankibox" / "ANKIBOX.md"
+
+    results = {}
+    for jobs in (1, io_jobs):
+        if ankinote.exists():
+            ankinote.unlink()
+        configure(folders={"INBOX": "{}/".format(notes)}, io_jobs=jobs)
+        forget_card_backs()
+
+        run("-a")
+        added = ankinote.read_bytes()
+        give_ids(ankinote)
+
+        # the delete's intermediary ankinote (DELETE chunks), then the final one
+        removed = [notes / "note {}.md".format(i) for i in range(3, 200, 5)]
+        texts = [path.read_text() for path in removed]
+        for path in removed:
+            path.unlink()
+        intermediary = []
+        monkeypatch.setattr(builtins, "input", lambda *args: intermediary.append(ankinote.read_bytes()) or "")
+        forget_card_backs()
+        run("-d")
+        for path, text in zip(removed, texts):
+            path.write_text(text)
+
+        results[jobs] = (added, intermediary[0], ankinote.read_bytes())
+
+    assert results[1][0].count(b"#anki/card") == 200
+    assert b"DELETE" in results[1][1]
+    assert results[1] == results[io_jobs]
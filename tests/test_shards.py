@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# sharded ankinote tests
+#
+# osgav 2023
+#
+
+
+import builtins
+import os
+import re
+
+import pytest
+
+import ankibox.ankibox
+from ankibox.ankibox import App
+from ankibox.ankibox import ShardedAnkiNote
+from ankibox.ankibox import get_parser
+from ankibox.fingerprint import get_fingerprint
+
+
+
+
+def run(*argv):
+    App(get_parser().parse_args(list(argv))).run()
+
+
+def get_titles(folder):
+    '''
+    the titles in every ankinote file in folder, by file name
+    '''
+    return {
+        path.name: re.findall(r"(?m)^(note \d+) #anki/card$", path.read_text())
+        for path in sorted(folder.glob("ANKIBOX*.md"))
+    }
+
+
+@pytest.fixture
+def sharded(inbox, configure, monkeypatch):
+    '''
+    an inbox of 20 notes, added to an ankinote in 4 shards
+    '''
+    for i in range(20):
+        (inbox / "note {}.md".format(i)).write_text("\nthe back of note {}\n".format(i))
+    configure(folders={"INBOX": "{}/".format(inbox)}, box_items={"shards": 4})
+    monkeypatch.setattr(builtins, "input", lambda *args: "")
+    run("-a")
+    return inbox
+
+
+
+
+def test_fewer_shards(sharded, configure):
+    folder = sharded / "ankibox"
+    assert sorted(get_titles(folder)) == ["ANKIBOX.{}.md".format(n) for n in range(4)]
+
+    configure(folders={"INBOX": "{}/".format(sharded)}, box_items={"shards": 2})
+    (sharded / "note 20.md").write_text("\nthe back of note 20\n")
+    run("-a")
+
+    titles = get_titles(folder)
+    assert sorted(titles) == ["ANKIBOX.0.md", "ANKIBOX.1.md"]
+    assert sorted(sum(titles.values(), [])) == sorted("note {}".format(i) for i in range(21))
+
+
+def test_back_to_one_file(sharded, configure):
+    folder = sharded / "ankibox"
+    configure(folders={"INBOX": "{}/".format(sharded)})
+    (sharded / "note 20.md").write_text("\nthe back of note 20\n")
+    run("-a")
+
+    titles = get_titles(folder)
+    assert sorted(titles) == ["ANKIBOX.md"]
+    assert sorted(titles["ANKIBOX.md"]) == sorted("note {}".format(i) for i in range(21))
+
+
+def test_nothing_new_is_not_added_again(sharded, configure):
+    '''
+    the entries still in the old shards count as already added
+    '''
+    configure(folders={"INBOX": "{}/".format(sharded)}, box_items={"shards": 2})
+    run("-a")
+
+    titles = sum(get_titles(sharded / "ankibox").values(), [])
+    assert sorted(titles) == sorted("note {}".format(i) for i in range(20))
+
+
+@pytest.mark.parametrize("shards", [0, -1, "4", 2.5, True])
+def test_invalid_shards(inbox, configure, shards):
+    with pytest.raises(SystemExit):
+        configure(folders={"INBOX": "{}/".format(inbox)}, box_items={"shards": shards})
+
+
+def test_unchanged_shards_are_not_read_back(sharded, configure, monkeypatch):
+    '''
+    a write skips the shards it would not change, without reading
+    them again, unless something else changed them since
+    '''
+    configure(folders={"INBOX": "{}/".format(sharded)}, box_items={"shards": 4}, mtime_granularity=0)
+    folder = sharded / "ankibox"
+    ankinote = ShardedAnkiNote({"name": "INBOX", "path": "{}/".format(sharded), "shards": 4}, "folder")
+    notes = tuple(ankinote.get_snapshot())
+    chunks = [note.chunk_style_first_line(as_is=True) for note in notes]
+    titles = [note.title for note in notes]
+    contents = {path.name: path.read_bytes() for path in folder.glob("ANKIBOX.*.md")}
+    fingerprints = {path.name: get_fingerprint(path) for path in folder.glob("ANKIBOX.*.md")}
+
+    opened = []
+    monkeypatch.setattr(ankibox.ankibox, "open", lambda path, *args: opened.append(path) or open(path, *args),
+                        raising=False)
+    ankinote.write_chunks_to_ankinote(chunks, titles)
+    assert opened == []
+    assert {path.name: get_fingerprint(path) for path in folder.glob("ANKIBOX.*.md")} == fingerprints
+
+    # e.g. the plugin writing IDs into one shard
+    (folder / "ANKIBOX.1.md").write_text("something else\n")
+    ankinote.write_chunks_to_ankinote(chunks, titles)
+    assert [os.path.basename(path) for path in opened] == ["ANKIBOX.1.md"]
+    assert {path.name: path.read_bytes() for path in folder.glob("ANKIBOX.*.md")} == contents
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+#
+# ankibox script 2.0
+#
+# VaultIndex tests
+#
+# osgav 2023
+#
+
+
+import logging
+import os
+import random
+
+import pytest
+
+from ankibox.ankibox import VaultIndex
+
+
+
+
+def scan_index(vault_root):
+    '''
+    the index as it used to be: every path in the vault, in os.walk order
+    '''
+    return [
+        "{}/{}".format(dir, file)
+        for dir, subdirs, files in os.walk(vault_root)
+        for file in files
+    ]
+
+
+def scan_lookup(index, filename):
+    '''
+    the lookup as it used to be: a substring scan over every path
+    '''
+    if "/" in filename:
+        for filepath in index:
+            if filename in filepath:
+                return filepath
+    else:
+        for filepath in index:
+            if "/{}".format(filename) in filepath:
+                return filepath
+
+
+def generate_tree(root, seed=0):
+    '''
+    a few levels of folders, each holding some of the same handful
+    of notes, so plenty of basenames are ambiguous
+    '''
+    rng = random.Random(seed)
+    dirs = [root]
+    for depth in range(3):
+        for parent in list(dirs):
+            for name in rng.sample(["d0", "d1", "d2", "d3"], rng.randint(0, 3)):
+                path = os.path.join(parent, name)
+                if not os.path.isdir(path):
+                    os.mkdir(path)
+                    dirs.append(path)
+    for dir in dirs:
+        for name in rng.sample(["n{}.md".format(i) for i in range(10)], rng.randint(1, 6)):
+            with open(os.path.join(dir, name), "w") as f:
+                f.write("a note\n")
+    with open(os.path.join(root, "unique note.md"), "w") as f:
+        f.write("a note\n")
+
+
+def get_lookups(vault_root):
+    '''
+    every basename in the vault, plus every 1-3 component path suffix
+    (with and without a leading "/")
+    '''
+    lookups = set()
+    for filepath in scan_index(vault_root):
+        parts = os.path.relpath(filepath, vault_root).split(os.sep)
+        for length in range(1, min(3, len(parts)) + 1):
+            suffix = "/".join(parts[-length:])
+            lookups.add(suffix)
+            lookups.add("/" + suffix)
+    lookups.add("missing.md")
+    lookups.add("d9/n1.md")
+    return sorted(lookups)
+
+
+@pytest.fixture
+def tree(vault, configure):
+    generate_tree(str(vault))
+    configure()
+    return "{}/".format(vault)
+
+
+
+
+def test_resolves_the_same_paths_as_the_scan(tree):
+    index = scan_index(tree)
+    lookups = get_lookups(tree)
+    assert any(len([p for p in index if p.endswith("/" + name)]) > 1 for name in lookups if "/" not in name)
+
+    for filename in lookups:
+        assert VaultIndex.get_note_filepath(filename) == scan_lookup(index, filename), filename
+
+
+def count_listings(monkeypatch):
+    '''
+    count the directories the VaultIndex lists (rather than taking
+    their listings from its cache)
+    '''
+    listed = []
+    list_directory = VaultIndex.list_directory
+
+    def counting_list_directory(self, dir, mtime_ns):
+        listed.append(dir)
+        return list_directory(self, dir, mtime_ns)
+    monkeypatch.setattr(VaultIndex, "list_directory", counting_list_directory)
+    return listed
+
+
+def test_resolves_the_same_paths_from_the_cache(tree, configure, monkeypatch):
+    # (the tree was only just made, so its mtimes are all "racy")
+    configure(mtime_granularity=0)
+    VaultIndex.load()
+    VaultIndex.unload()
+
+    # a second load reads every directory listing from the cache
+    listed = count_listings(monkeypatch)
+    index = scan_index(tree)
+    for filename in get_lookups(tree):
+        assert VaultIndex.get_note_filepath(filename) == scan_lookup(index, filename), filename
+    assert listed == []
+
+
+def test_refreshes_only_the_changed_directories(tree, configure, monkeypatch):
+    configure(mtime_granularity=0)
+    VaultIndex.load()
+    VaultIndex.unload()
+
+    subdir = next(dir for dir, subdirs, files in os.walk(tree) if dir != tree and not subdirs)
+    with open(os.path.join(subdir, "new note.md"), "w") as f:
+        f.write("a note\n")
+    removed = next(dir for dir, subdirs, files in os.walk(tree) if dir != tree and dir != subdir
+                   and os.path.dirname(dir) != os.path.dirname(subdir) and not subdirs)
+    for file in os.listdir(removed):
+        os.remove(os.path.join(removed, file))
+    os.rmdir(removed)
+
+    listed = count_listings(monkeypatch)
+    index = scan_index(tree)
+    for filename in get_lookups(tree) + ["new note.md"]:
+        assert VaultIndex.get_note_filepath(filename) == scan_lookup(index, filename), filename
+    assert sorted(listed) == sorted([subdir, os.path.dirname(removed)])
+
+
+def test_ambiguous_filenames(tree):
+    index = scan_index(tree)
+    ambiguous = VaultIndex.get_ambiguous_filenames()
+    for filename, filepaths in ambiguous.items():
+        assert filepaths == [p for p in index if p.endswith("/" + filename)]
+    assert "unique note.md" not in ambiguous
+    assert len(ambiguous) > 0
+
+
+def test_ambiguous_filename_is_reported_once(tree, caplog):
+    filename = next(iter(VaultIndex.get_ambiguous_filenames()))
+    with caplog.at_level(logging.WARNING, logger="VaultIndex"):
+        for _ in range(3):
+            VaultIndex.get_note_filepath(filename)
+    assert len([r for r in caplog.records if filename in r.getMessage()]) == 1
+
+
+def test_partial_path_components_no_longer_match(vault, configure):
+    '''
+    the one intended difference: the scan matched a lookup with a
+    "/" anywhere in a path, even part way through a folder's name,
+    the index only matches whole path components
+    '''
+    os.makedirs(os.path.join(str(vault), "d1"))
+    with open(os.path.join(str(vault), "d1", "n7.md"), "w") as f:
+        f.write("a note\n")
+    configure()
+    index = scan_index("{}/".format(vault))
+
+    assert scan_lookup(index, "1/n7.md") == "{}/d1/n7.md".format(vault)
+    assert VaultIndex.get_note_filepath("1/n7.md") is None
+    assert VaultIndex.get_note_filepath("d1/n7.md") == "{}/d1/n7.md".format(vault)
+
+
+def test_expire_refreshes_in_memory(vault, configure, monkeypatch):
+    os.makedirs(os.path.join(str(vault), "d1"))
+    with open(os.path.join(str(vault), "d1", "n1.md"), "w") as f:
+        f.write("a note\n")
+    configure(mtime_granularity=0)
+    assert VaultIndex.get_note_filepath("n1.md") == "{}/d1/n1.md".format(vault)
+    index = VaultIndex._index
+
+    # nothing changed: the index is kept, and the cache file isn't read
+    monkeypatch.setattr(VaultIndex, "load_cache", lambda self: pytest.fail("cache file read"))
+    VaultIndex.expire()
+    assert VaultIndex.get_note_filepath("n1.md") == "{}/d1/n1.md".format(vault)
+    assert VaultIndex._index is index
+
+    # a new note is found after the next expire()
+    with open(os.path.join(str(vault), "d1", "n2.md"), "w") as f:
+        f.write("a note\n")
+    assert VaultIndex.get_note_filepath("n2.md") is None
+    VaultIndex.expire()
+    assert VaultIndex.get_note_filepath("n2.md") == "{}/d1/n2.md".format(vault)
+
+
+@pytest.mark.parametrize("storage", ["ankinotes [1]", "system/ankinotes"])
+def test_ankinote_storage_is_excluded(vault, configure, storage):
+    '''
+    file_ankinote_storage is never indexed when it's inside the vault
+    (even if its name has glob characters in it)
+    '''
+    os.makedirs(os.path.join(str(vault), storage))
+    os.makedirs(os.path.join(str(vault), "d1"))
+    for dir in ("d1", storage):
+        with open(os.path.join(str(vault), dir, "n1.md"), "w") as f:
+            f.write("a note\n")
+    with open(os.path.join(str(vault), storage, "ANKIBOX QUEUE.md"), "w") as f:
+        f.write("an ankinote\n")
+    configure(file_ankinote_storage="{}/{}/".format(vault, storage))
+
+    assert VaultIndex.get_note_filepath("ANKIBOX QUEUE.md") is None
+    assert VaultIndex.get_note_filepath("n1.md") == "{}/d1/n1.md".format(vault)
+
+
+def test_rebuild_reports_the_counts(vault, configure, caplog):
+    os.makedirs(os.path.join(str(vault), ".obsidian"))
+    for name in ("n1.md", "n2.md", "image.png"):
+        with open(os.path.join(str(vault), name), "w") as f:
+            f.write("a file\n")
+    configure()
+
+    with caplog.at_level(logging.INFO):
+        VaultIndex(rebuild=True)
+    assert "vault index rebuilt: 2 files indexed, 1 files and 1 directories skipped" in caplog.text